@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+# Closed-loop load against a running server, e.g.
+#   WEB_CONCURRENCY=2 gunicorn main:app --config gunicorn.conf.py
+#   python bench/load.py --url http://127.0.0.1:8000 --clients 64 --duration 30
+# Needs httpx, which is not part of the app requirements.
+
+SEED_ITEMS = 200
+
+
+async def seed(client: httpx.AsyncClient) -> dict:
+    sku_id = str(uuid.uuid4())
+    response = await client.post("/createAcceptance", json={"items_to_accept": [{"sku_id": sku_id,
+                                                                                 "count": SEED_ITEMS}]})
+    response.raise_for_status()
+    acceptance_id = response.json()["id"]
+    response = await client.get("/getAcceptanceInfo", params={"id": acceptance_id})
+    response.raise_for_status()
+    tasks = [{"id": task["id"], "status": "completed"} for task in response.json()["task_ids"]]
+    response = await client.post("/finishTasks", json={"tasks": tasks})
+    response.raise_for_status()
+    return {"sku_id": sku_id, "acceptance_id": acceptance_id}
+
+
+def requests_mix(seeded: dict) -> list:
+    # Mostly uncached reads, with a share of small writes.
+    return [
+        (6, "getItemInfoBySkuId", lambda client: client.get("/getItemInfoBySkuId",
+                                                            params={"id": seeded["sku_id"], "limit": 100})),
+        (3, "getAcceptanceInfo", lambda client: client.get("/getAcceptanceInfo",
+                                                           params={"id": seeded["acceptance_id"], "limit": 100})),
+        (1, "createAcceptance", lambda client: client.post("/createAcceptance", json={
+            "items_to_accept": [{"sku_id": seeded["sku_id"], "count": 1}]})),
+    ]
+
+
+async def client_loop(client, mix, deadline, latencies, errors):
+    weights = [weight for weight, _, _ in mix]
+    while time.monotonic() < deadline:
+        _, name, send = random.choices(mix, weights)[0]
+        started = time.monotonic()
+        try:
+            response = await send(client)
+            failure = response.status_code if response.status_code >= 500 else None
+        except httpx.HTTPError as exc:
+            failure = type(exc).__name__
+        latencies[name].append(time.monotonic() - started)
+        if failure is not None:
+            errors[name][failure] += 1
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main(url: str, clients: int, duration: float) -> None:
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        mix = requests_mix(await seed(client))
+        latencies = defaultdict(list)
+        errors = defaultdict(Counter)
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*[client_loop(client, mix, deadline, latencies, errors) for _ in range(clients)])
+
+    total = sum(len(values) for values in latencies.values())
+    failed = sum(sum(counts.values()) for counts in errors.values())
+    print(f"{total} requests in {duration:.0f}s, {total / duration:.1f} req/s, {failed} errors")
+    for name, values in sorted(latencies.items()):
+        print(f"{name:20} n={len(values):6} errors={sum(errors[name].values()):4} "
+              f"p50={statistics.median(values) * 1000:7.1f}ms "
+              f"p95={percentile(values, 0.95) * 1000:7.1f}ms p99={percentile(values, 0.99) * 1000:7.1f}ms"
+              + (f" {dict(errors[name])}" if errors[name] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate mixed read/write load against the API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.clients, args.duration))
@@ -1,4 +1,5 @@
 from dotenv import load_dotenv
+import math
 import os
 
 load_dotenv()
@@ -10,3 +11,77 @@ DB_USER = os.environ.get("DB_USER")
 DB_PASS = os.environ.get("DB_PASS")
 
 
+
+POSTING_CACHE_TTL = float(os.environ.get("POSTING_CACHE_TTL", 0))
+
+TASK_CLAIM_TIMEOUT = float(os.environ.get("TASK_CLAIM_TIMEOUT", 300))
+TASK_POLL_INTERVAL = float(os.environ.get("TASK_POLL_INTERVAL", 0.5))
+
+DISCOUNT_SCHEDULER_INTERVAL = float(os.environ.get("DISCOUNT_SCHEDULER_INTERVAL", 5))
+STOCK_COUNTER_COMPACT_INTERVAL = float(os.environ.get("STOCK_COUNTER_COMPACT_INTERVAL", 10))
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+JOB_CHUNK_SIZE = int(os.environ.get("JOB_CHUNK_SIZE", 500))
+JOB_LEASE_TIMEOUT = float(os.environ.get("JOB_LEASE_TIMEOUT", 60))
+
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", 30))
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", 100000))
+REDIS_URL = os.environ.get("REDIS_URL")
+
+DB_REPLICA_HOSTS = [host.strip() for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+REPLICA_CONNECT_TIMEOUT = float(os.environ.get("REPLICA_CONNECT_TIMEOUT", 2))
+REPLICA_RETRY_INTERVAL = float(os.environ.get("REPLICA_RETRY_INTERVAL", 10))
+READ_YOUR_WRITES_WINDOW = int(os.environ.get("READ_YOUR_WRITES_WINDOW", 5))
+
+
+def _cgroup_cpu_limit():
+    # cgroup v2 exposes "<quota> <period>" in cpu.max, v1 splits it over two
+    # files; a quota of "max" or -1 means the container is not limited.
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    if quota in ("max", "-1"):
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+
+def available_cpus() -> int:
+    # os.cpu_count() reports the host, not the CPUs the container may use.
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    return min(cpus, limit) if limit is not None else cpus
+
+
+# Each gunicorn worker has its own engine, so the connection budget the app
+# may use on Postgres is split across workers; one connection per worker is
+# left for the event listener. The default worker count is capped so every
+# worker gets at least one pooled connection.
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", 90))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", max(1, min(available_cpus(), DB_MAX_CONNECTIONS // 2))))
+DB_WORKER_CONNECTIONS = DB_MAX_CONNECTIONS // WEB_CONCURRENCY - 1
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", max(1, DB_WORKER_CONNECTIONS // 2)))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", max(0, DB_WORKER_CONNECTIONS - DB_POOL_SIZE)))
+if WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1) > DB_MAX_CONNECTIONS:
+    raise RuntimeError(
+        f"{WEB_CONCURRENCY} workers with DB_POOL_SIZE={DB_POOL_SIZE}, DB_MAX_OVERFLOW={DB_MAX_OVERFLOW} and an "
+        f"event listener each need {WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1)} connections, "
+        f"more than DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS}; lower WEB_CONCURRENCY or the pool settings"
+    )
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+SERVER_LOOP = os.environ.get("SERVER_LOOP", "auto")
+SERVER_HTTP = os.environ.get("SERVER_HTTP", "auto")
+MAX_REQUESTS = int(os.environ.get("MAX_REQUESTS", 10000))
+MAX_REQUESTS_JITTER = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
@@ -1,70 +1,105 @@
 import uuid
 from datetime import datetime
-from fastapi import HTTPException, Depends, APIRouter
-from sqlalchemy import select, insert
+from typing import Optional
+from fastapi import HTTPException, Depends, APIRouter, Request, Query
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql.functions import func
-from database import get_async_session
-from models import acceptance, task
-from schemas import AcceptanceRequest
+from database import get_async_session, get_async_read_session
+from models import acceptance
+from schemas import AcceptanceRequest, ItemToAccept
+from services.events import make_event, publish
+from services.acceptance import insert_placing_tasks
+from services.jobs import enqueue_job
+from services.queries import acceptance_info_query
+from services.streaming import RowErrors, iter_valid_rows, stream_format
 from uuid import UUID
 
 
+ACCEPTANCE_CHUNK_SIZE = 5000
+
 router = APIRouter(
     tags=["AcceptanceController"]
 )
 
 
 @router.get("/getAcceptanceInfo")
-async def get_acceptance_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
-
-    query = select(acceptance.c.id).where(acceptance.c.id == id)
-    result = await session.execute(query)
-    if result.scalar() is None:
-        raise HTTPException(status_code=404, detail="ID not found")
+async def get_acceptance_info(id: uuid.UUID, cursor: Optional[uuid.UUID] = None,
+                              limit: int = Query(default=1000, ge=1, le=10000),
+                              session: AsyncSession = Depends(get_async_read_session)):
 
-    query_tasks = select(task).where(task.c.process_id == id)
-    tasks_result = await session.execute(query_tasks)
-    tasks_info = tasks_result.mappings().all()
-
-    query_acceptance = select(acceptance.c.id, acceptance.c.created_at).where(acceptance.c.id == id)
-    acceptance_result = await session.execute(query_acceptance)
+    acceptance_result = await session.execute(acceptance_info_query(id, cursor, limit))
     acceptance_info = acceptance_result.mappings().all()
 
-    query_sku = select(func.count(func.distinct(task.c.id)).label('sku_count'), task.c.sku_id,
-                       task.c.stock).where(task.c.process_id == id).group_by(task.c.sku_id, task.c.stock)
-    sku_result = await session.execute(query_sku)
-    sku_info = sku_result.mappings().all()
+    if len(acceptance_info) == 0:
+        raise HTTPException(status_code=404, detail="ID not found")
+
+    tasks_info = acceptance_info[0].task_ids
+    next_cursor = None
+    if len(tasks_info) > limit:
+        tasks_info = tasks_info[:limit]
+        next_cursor = tasks_info[-1]["id"]
 
     response_data = {
         "id": str(acceptance_info[0].id),
         "created_at": str(acceptance_info[0].created_at),
-        "accepted": [{"sku_id": str(sku_info.sku_id), "stock": str(sku_info.stock),
-                      "count": str(sku_info.sku_count)} for sku_info in sku_info],
-        "task_ids": [{"id": str(task_info.id), "status": task_info.status} for task_info in tasks_info]
+        "accepted": [{"sku_id": str(sku_info["sku_id"]), "stock": str(sku_info["stock"]),
+                      "count": str(sku_info["count"])} for sku_info in acceptance_info[0].accepted],
+        "task_ids": [{"id": str(task_info["id"]), "status": task_info["status"]} for task_info in tasks_info],
+        "next_cursor": next_cursor
     }
 
     return response_data
 
 
 @router.post("/createAcceptance")
-async def create_acceptance(items_to_accept: AcceptanceRequest, session: AsyncSession = Depends(get_async_session)):
+async def create_acceptance(items_to_accept: AcceptanceRequest, background: bool = False,
+                            session: AsyncSession = Depends(get_async_session)):
 
     new_acceptance = uuid.uuid4()
 
-    for i in range(len(items_to_accept.items_to_accept)):
-        for c in range(items_to_accept.items_to_accept[i].count):
-            stmt_insert = insert(task).values([
-                uuid.uuid4(),
-                "in_work", datetime.utcnow(),
-                "placing", new_acceptance,
-                items_to_accept.items_to_accept[i].sku_id,
-                items_to_accept.items_to_accept[i].stock,
-                uuid.uuid4(),
-                None])
-            await session.execute(stmt_insert)
-
     stmt = insert(acceptance).values([new_acceptance, datetime.utcnow()])
     await session.execute(stmt)
+
+    if background:
+        payload = {"acceptance_id": str(new_acceptance),
+                   "items": [item.model_dump(mode="json") for item in items_to_accept.items_to_accept]}
+        job_id = await enqueue_job(session, "create_acceptance", payload,
+                                   total=sum(item.count for item in items_to_accept.items_to_accept))
+        await session.commit()
+        return {"id": new_acceptance, "job_id": job_id}
+
+    await insert_placing_tasks(session, new_acceptance, items_to_accept.items_to_accept)
+    await publish(session, [make_event("acceptance", new_acceptance, status="created")])
     await session.commit()
     return {"id": new_acceptance}
+
+
+@router.post("/createAcceptanceStream")
+async def create_acceptance_stream(request: Request, session: AsyncSession = Depends(get_async_session)):
+
+    new_acceptance = uuid.uuid4()
+    stmt = insert(acceptance).values([new_acceptance, datetime.utcnow()])
+    await session.execute(stmt)
+
+    chunk = []
+    accepted_rows = 0
+    accepted_units = 0
+    errors = RowErrors()
+
+    async for line_number, row in iter_valid_rows(request.stream(), stream_format(request), ItemToAccept, errors):
+        chunk.append(row)
+        accepted_rows += 1
+        accepted_units += row.count
+        if len(chunk) >= ACCEPTANCE_CHUNK_SIZE:
+            await insert_placing_tasks(session, new_acceptance, chunk)
+            chunk = []
+    await insert_placing_tasks(session, new_acceptance, chunk)
+
+    if accepted_rows == 0:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail={"message": "No valid rows in manifest", **errors.as_dict()})
+
+    await publish(session, [make_event("acceptance", new_acceptance, status="created")])
+    await session.commit()
+    return {"id": new_acceptance, "accepted_rows": accepted_rows, "accepted_units": accepted_units,
+            **errors.as_dict()}
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from services.cache import cache_stats
+
+router = APIRouter(
+    tags=["CacheApi"]
+)
+
+
+@router.get("/getCacheStats")
+async def get_cache_stats():
+
+    return cache_stats()
@@ -1,11 +1,16 @@
 import uuid
 from datetime import datetime
 from fastapi import HTTPException, Depends, APIRouter
-from sqlalchemy import select, insert
+from sqlalchemy import select, insert, cast, any_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_async_session
-from models import sku, stock_table, discount
+from database import get_async_session, get_async_read_session
+from models import sku, discount
 from schemas import DiscountRequest, RequestId
+from services.cache import invalidate_skus, broadcast_invalidation
+from services.discounts import link_discount_skus, finish_discounts
+from services.jobs import enqueue_job
+from services.pricing import reprice_items
 
 router = APIRouter(
     tags=["DiscountApi"]
@@ -13,7 +18,7 @@ router = APIRouter(
 
 
 @router.get("/getDiscount")
-async def get_discount(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+async def get_discount(id: uuid.UUID, session: AsyncSession = Depends(get_async_read_session)):
 
     query = select(discount).where(discount.c.id == id)
     result = await session.execute(query)
@@ -30,73 +35,74 @@ async def get_discount(id: uuid.UUID, session: AsyncSession = Depends(get_async_
 
 
 @router.post("/createDiscount")
-async def create_discount(discount_request: DiscountRequest, session: AsyncSession = Depends(get_async_session)):
-
-    query_check = select(sku).where(sku.c.id.in_(discount_request.sku_ids), sku.c.active_discount.is_(None))
-    result = await session.execute(query_check)
-    sku_ids_list = result.mappings().all()
-
-    if len(sku_ids_list) != len(discount_request.sku_ids):
-        raise HTTPException(status_code=404, detail="Some sku_id not found or already have active discount")
+async def create_discount(discount_request: DiscountRequest, background: bool = False,
+                          session: AsyncSession = Depends(get_async_session)):
 
+    now = datetime.utcnow()
+    starts_at = discount_request.starts_at or now
+    scheduled = starts_at > now
     new_id_discount = uuid.uuid4()
 
-    update_sku = sku.update().values(active_discount=new_id_discount) \
-        .where(sku.c.id.in_(discount_request.sku_ids), sku.c.active_discount.is_(None))
-    await session.execute(update_sku)
-
-    stmt = insert(discount).values([new_id_discount, "active", datetime.utcnow(), discount_request.percentage])
+    if scheduled:
+        query_check = select(sku.c.id).where(sku.c.id.in_(discount_request.sku_ids))
+        result = await session.execute(query_check)
+        if len(result.all()) != len(discount_request.sku_ids):
+            raise HTTPException(status_code=404, detail="Some sku_id not found")
+    else:
+        update_sku = sku.update().values(active_discount=new_id_discount) \
+            .where(sku.c.id.in_(discount_request.sku_ids), sku.c.active_discount.is_(None)) \
+            .returning(sku.c.id)
+        result = await session.execute(update_sku)
+
+        if len(result.all()) != len(discount_request.sku_ids):
+            await session.rollback()
+            raise HTTPException(status_code=404, detail="Some sku_id not found or already have active discount")
+
+    stmt = insert(discount).values(id=new_id_discount, status="scheduled" if scheduled else "active",
+                                   created_at=now, percentage=discount_request.percentage,
+                                   starts_at=starts_at, ends_at=discount_request.ends_at)
     await session.execute(stmt)
+    await link_discount_skus(session, new_id_discount, discount_request.sku_ids)
+    if not scheduled and background:
+        job_id = await enqueue_job(session, "reprice_skus",
+                                   {"sku_ids": [str(sku_id) for sku_id in set(discount_request.sku_ids)]})
+        await broadcast_invalidation(session, [], discount_request.sku_ids)
+        await session.commit()
+        await invalidate_skus(discount_request.sku_ids)
+        return {"id": str(new_id_discount), "job_id": str(job_id)}
+    if not scheduled:
+        await reprice_items(session, sku.c.active_discount == new_id_discount)
+        await broadcast_invalidation(session, [], discount_request.sku_ids)
     await session.commit()
-
-    query_check = select(stock_table, sku.c.base_price, discount.c.percentage)\
-        .join(sku, sku.c.id == stock_table.c.sku_id) \
-        .join(discount, discount.c.id == sku.c.active_discount) \
-        .where(sku.c.id.in_(discount_request.sku_ids))
-    result = await session.execute(query_check)
-    item_list = result.mappings().all()
-
-    for c in range(len(item_list)):
-        new_actual_price = round(item_list[c].base_price * min(1 - item_list[c].percentage, 1 - item_list[c].markdown), 2)
-        update_price = stock_table.update().values(actual_price=new_actual_price) \
-            .where(stock_table.c.id == item_list[c].id)
-        await session.execute(update_price)
+    if not scheduled:
+        await invalidate_skus(discount_request.sku_ids)
 
     return {"id": str(new_id_discount)}
 
 
 @router.post("/cancelDiscount")
-async def cancel_discount(id: RequestId, session: AsyncSession = Depends(get_async_session)):
+async def cancel_discount(id: RequestId, background: bool = False, session: AsyncSession = Depends(get_async_session)):
 
-    query_check = select(discount, sku)\
-        .join(sku, sku.c.active_discount == discount.c.id)\
-        .where(discount.c.id == id.id, discount.c.status == "active")
-    result = await session.execute(query_check)
-    result_info = result.mappings().all()
+    update_discount = discount.update().values(status="finished") \
+        .where(discount.c.id == id.id, discount.c.status.in_(["active", "scheduled"])) \
+        .returning(discount.c.id)
+    result = await session.execute(update_discount)
 
-    if len(result_info) == 0:
+    if result.scalar() is None:
         raise HTTPException(status_code=404, detail="ID not found or already finished")
 
-    update_discount = discount.update().values(status="finished") \
-        .where(discount.c.id == id.id)
-    await session.execute(update_discount)
-
-    query_check = select(stock_table, sku.c.base_price, discount.c.percentage) \
-        .join(sku, sku.c.id == stock_table.c.sku_id) \
-        .join(discount, discount.c.id == sku.c.active_discount)\
-        .where(discount.c.id == id.id)
-    result = await session.execute(query_check)
-    item_list = result.mappings().all()
-
-    for c in range(len(item_list)):
-        new_actual_price = round(item_list[c].base_price * (1 - item_list[c].markdown), 2)
-        update_price = stock_table.update().values(actual_price=new_actual_price) \
-            .where(stock_table.c.id == item_list[c].id)
-        await session.execute(update_price)
-
-    update_finish_discount_info = sku.update().values(active_discount=None) \
-        .where(sku.c.active_discount == id.id)
-    await session.execute(update_finish_discount_info)
+    sku_ids = await finish_discounts(session, [id.id])
+
+    if background:
+        job_id = await enqueue_job(session, "reprice_skus", {"sku_ids": [str(sku_id) for sku_id in sku_ids]})
+        await broadcast_invalidation(session, [], sku_ids)
+        await session.commit()
+        await invalidate_skus(sku_ids)
+        return {"status": "Discount finished", "job_id": str(job_id)}
+
+    await reprice_items(session, sku.c.id == any_(cast(sku_ids, ARRAY(SQLAlchemyUUID(as_uuid=True)))))
+    await broadcast_invalidation(session, [], sku_ids)
     await session.commit()
+    await invalidate_skus(sku_ids)
 
     return {"Discount finished"}
@@ -0,0 +1,36 @@
+import asyncio
+import json
+import uuid
+from typing import List
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from services.events import broker
+
+HEARTBEAT_INTERVAL = 15
+
+router = APIRouter(
+    tags=["EventsApi"]
+)
+
+
+@router.get("/events")
+async def stream_events(request: Request,
+                        posting_id: List[uuid.UUID] = Query(default=[]),
+                        acceptance_id: List[uuid.UUID] = Query(default=[])):
+
+    subscription = broker.subscribe(posting_id, acceptance_id)
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {event['scope']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
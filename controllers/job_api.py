@@ -0,0 +1,24 @@
+import uuid
+from fastapi import HTTPException, Depends, APIRouter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_session
+from models import job
+
+router = APIRouter(
+    tags=["JobApi"]
+)
+
+
+@router.get("/getJob")
+async def get_job(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+
+    query = select(job.c.id, job.c.type, job.c.status, job.c.progress, job.c.total, job.c.result, job.c.error,
+                   job.c.created_at, job.c.updated_at).where(job.c.id == id)
+    result = await session.execute(query)
+    result_info = result.mappings().all()
+
+    if len(result_info) == 0:
+        raise HTTPException(status_code=404, detail="ID not found")
+
+    return result_info[0]
@@ -1,12 +1,19 @@
 import uuid
 from datetime import datetime
 from fastapi import HTTPException, Depends, APIRouter
-from sqlalchemy import select, insert
+from sqlalchemy import select, insert, literal, null, DateTime
+from sqlalchemy.dialects.postgresql import UUID as SQLAlchemyUUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.functions import func
-from database import get_async_session
-from models import task, sku, stock_table, posting
-from schemas import PostingRequest, RequestId
+from database import get_async_session, get_async_read_session
+from models import task, sku, posting
+from schemas import PostingRequest, QuantityPostingRequest, RequestId
+from services.cache import posting_cache, invalidate_items, broadcast_invalidation
+from services.events import make_event, publish
+from services.queries import posting_query
+from services.reservation import RequestedItems, count_requested_items, reserve_items, insert_picking_tasks, \
+    group_quantities, allocate_items
+from services.stock_counters import free_item_counts
 
 router = APIRouter(
     tags=["PostingController"]
@@ -14,57 +21,28 @@ router = APIRouter(
 
 
 @router.get("/getPosting")
-async def get_posting(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+async def get_posting(id: uuid.UUID, session: AsyncSession = Depends(get_async_read_session)):
 
-    query_posting = select(posting).where(posting.c.id == id)
-    result = await session.execute(query_posting)
+    cached = posting_cache.get(id)
+    if cached is not None:
+        return cached
+
+    result = await session.execute(posting_query(id))
     posting_list = result.mappings().all()
     if len(posting_list) == 0:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    query_cost = select(func.sum(stock_table.c.actual_price).label('cost')) \
-        .join(task, task.c.item_id == stock_table.c.id) \
-        .where(task.c.posting_id == id,
-               stock_table.c.stock != "NotFound",
-               stock_table.c.reserved_state.is_(True))
-    result = await session.execute(query_cost)
-    cost_list = result.mappings().all()
-
-    query_stock = select(task).where(task.c.posting_id == id)
-    result = await session.execute(query_stock)
-    stock_list = result.mappings().all()
-
-    ordered_goods = {}
-
-    for item in stock_list:
-        if item.sku_id not in ordered_goods:
-            ordered_goods[item.sku_id] = {"sku": item.sku_id, "from_valid_ids": [], "from_defect_ids": []}
-        if item.stock == "valid":
-            ordered_goods[item.sku_id]["from_valid_ids"].append(item.item_id)
-        elif item.stock == "defect":
-            ordered_goods[item.sku_id]["from_defect_ids"].append(item.item_id)
-    ordered_goods_list = list(ordered_goods.values())
-
-    query_notfound = select(stock_table.c.id) \
-        .join(task, task.c.item_id == stock_table.c.id) \
-        .where(task.c.posting_id == id, stock_table.c.stock == "NotFound")
-    result = await session.execute(query_notfound)
-    notfound = result.mappings().all()
-
-    query_task = select(task.c.id, task.c.type, task.c.status).where(task.c.posting_id == id)
-    result = await session.execute(query_task)
-    task_list = result.mappings().all()
-
     response_data = {
         "id": str(posting_list[0].id),
         "status": str(posting_list[0].status),
         "created_at": str(posting_list[0].created_at),
-        "cost": str(cost_list[0].cost),
-        "ordered_goods": list(ordered_goods_list),
-        "not_found": list(notfound),
-        "task_ids": list(task_list)
+        "cost": str(posting_list[0].cost),
+        "ordered_goods": posting_list[0].ordered_goods,
+        "not_found": posting_list[0].not_found,
+        "task_ids": posting_list[0].task_ids
     }
 
+    posting_cache.set(id, response_data)
     return response_data
 
 
@@ -79,99 +57,97 @@ async def create_posting(order_request: PostingRequest, session: AsyncSession =
     if len(sku_ids_list) != len(sku_ids):
         raise HTTPException(status_code=404, detail="Some sku not found or sku is hidden")
 
-    for i in range(len(sku_ids)):
-        if not order_request.ordered_goods[i].from_valid_ids is None:
-            valid_list = order_request.ordered_goods[i].from_valid_ids
-            query_check_valid = select(stock_table.c.id).where(stock_table.c.id.in_(valid_list),
-                                                               stock_table.c.stock == "valid",
-                                                               stock_table.c.reserved_state.is_(False))
-            result = await session.execute(query_check_valid)
-            valid_item_check = result.mappings().all()
-            if len(valid_item_check) != len(valid_list):
-                raise HTTPException(status_code=404, detail="Some item not found or reserved or placed in another stock")
-        if not order_request.ordered_goods[i].from_defect_ids is None:
-            defect_list = order_request.ordered_goods[i].from_defect_ids
-            query_check_defect = select(stock_table.c.id).where(stock_table.c.id.in_(defect_list),
-                                                                stock_table.c.stock == "defect",
-                                                                stock_table.c.reserved_state.is_(False))
-            result = await session.execute(query_check_defect)
-            defect_item_check = result.mappings().all()
-            if len(defect_item_check) != len(defect_list):
-                raise HTTPException(status_code=404, detail="Some item not found or reserved or placed in another stock")
+    requested = RequestedItems(order_request.ordered_goods)
+
+    found, free = await count_requested_items(session, requested)
+    if found != len(requested):
+        raise HTTPException(status_code=404, detail="Some item not found or placed in another stock")
+    if free != len(requested):
+        raise HTTPException(status_code=409, detail="Some item is already reserved")
 
     new_posting_id = uuid.uuid4()
 
-    for i in range(len(sku_ids)):
-        if not order_request.ordered_goods[i].from_valid_ids is None:
-            valid_list = order_request.ordered_goods[i].from_valid_ids
-            for c in range(len(valid_list)):
-                stmt_valid_list = insert(task).values([
-                    uuid.uuid4(),
-                    "in_work", datetime.utcnow(),
-                    "picking", None,
-                    sku_ids[i],
-                    "valid",
-                    valid_list[c],
-                    new_posting_id])
-                await session.execute(stmt_valid_list)
-                update_reserved_valid = stock_table.update().values(reserved_state=True)\
-                    .where(stock_table.c.id == valid_list[c])
-                await session.execute(update_reserved_valid)
-        if not order_request.ordered_goods[i].from_defect_ids is None:
-            defect_list = order_request.ordered_goods[i].from_defect_ids
-            for c in range(len(defect_list)):
-                stmt_defect_list = insert(task).values([
-                    uuid.uuid4(),
-                    "in_work", datetime.utcnow(),
-                    "picking", None,
-                    sku_ids[i],
-                    "defect",
-                    defect_list[c],
-                    new_posting_id])
-                await session.execute(stmt_defect_list)
-                update_reserved_defect = stock_table.update().values(reserved_state=True) \
-                    .where(stock_table.c.id == defect_list[c])
-                await session.execute(update_reserved_defect)
+    reserved_ids = await reserve_items(session, requested)
+    if len(reserved_ids) != len(requested):
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Some item was reserved by another posting")
+
+    await insert_picking_tasks(session, new_posting_id, requested)
 
     stmt_posting = insert(posting).values([new_posting_id, "in_item_pick", datetime.utcnow()])
     await session.execute(stmt_posting)
+    await publish(session, [make_event("posting", new_posting_id, status="in_item_pick")])
+    await broadcast_invalidation(session, requested.item_ids, requested.sku_ids)
     await session.commit()
+    await invalidate_items(requested.item_ids, requested.sku_ids)
 
     return {"id": new_posting_id}
 
 
-@router.post("/cancelPosting")
-async def cancel_posting(id: RequestId, session: AsyncSession = Depends(get_async_session)):
+@router.post("/createPostingByQuantity")
+async def create_posting_by_quantity(order_request: QuantityPostingRequest,
+                                     session: AsyncSession = Depends(get_async_session)):
 
-    query_check = select(posting).where(posting.c.id == id.id, posting.c.status == "in_item_pick")
+    quantities = group_quantities(order_request.ordered_goods)
+    sku_ids = list({sku_id for sku_id, stock in quantities})
+    query_check = select(sku.c.id).where(sku.c.id.in_(sku_ids), sku.c.is_hidden.is_(False))
     result = await session.execute(query_check)
-    result_info = result.mappings().all()
+    sku_ids_list = result.mappings().all()
 
-    if len(result_info) == 0:
-        raise HTTPException(status_code=404, detail="ID not found or already canceled or sent")
+    if len(sku_ids_list) != len(sku_ids):
+        raise HTTPException(status_code=404, detail="Some sku not found or sku is hidden")
+
+    free_counts = await free_item_counts(session, sku_ids)
+    if any(free_counts.get(key, 0) < quantity for key, quantity in quantities.items()):
+        raise HTTPException(status_code=404, detail="Not enough free items for some sku")
+
+    allocated = await allocate_items(session, quantities)
+    if len(allocated) != sum(quantities.values()):
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="Not enough free items for some sku")
+
+    new_posting_id = uuid.uuid4()
+
+    await insert_picking_tasks(session, new_posting_id, allocated)
 
-    update_stmt = task.update().values(status="canceled").where(task.c.posting_id == id.id)
-    await session.execute(update_stmt)
+    stmt_posting = insert(posting).values([new_posting_id, "in_item_pick", datetime.utcnow()])
+    await session.execute(stmt_posting)
+    await publish(session, [make_event("posting", new_posting_id, status="in_item_pick")])
+    await broadcast_invalidation(session, allocated.item_ids, allocated.sku_ids)
     await session.commit()
+    await invalidate_items(allocated.item_ids, allocated.sku_ids)
+
+    return {"id": new_posting_id}
+
 
-    query_task = select(task).where(task.c.posting_id == id.id)
-    result = await session.execute(query_task)
-    result_task_info = result.mappings().all()
-
-    for c in range(len(result_task_info)):
-        stmt_new_task = insert(task).values([
-            uuid.uuid4(),
-            "in_work", datetime.utcnow(),
-            "placing", None,
-            result_task_info[c].sku_id,
-            result_task_info[c].stock,
-            result_task_info[c].item_id,
-            id.id])
-        await session.execute(stmt_new_task)
-
-    update_posting = posting.update().values(status="canceled").where(posting.c.id == id.id)
-    await session.execute(update_posting)
+@router.post("/cancelPosting")
+async def cancel_posting(id: RequestId, session: AsyncSession = Depends(get_async_session)):
+
+    update_posting = posting.update().values(status="canceled") \
+        .where(posting.c.id == id.id, posting.c.status == "in_item_pick") \
+        .returning(posting.c.id)
+    result = await session.execute(update_posting)
+
+    if result.scalar() is None:
+        raise HTTPException(status_code=404, detail="ID not found or already canceled or sent")
+
+    canceled_tasks = task.update().values(status="canceled").where(task.c.posting_id == id.id) \
+        .returning(task.c.sku_id, task.c.stock, task.c.item_id) \
+        .cte("canceled_tasks")
+    query_return = select(
+        func.gen_random_uuid(),
+        literal("in_work"), literal(datetime.utcnow(), DateTime),
+        literal("placing"), null(),
+        canceled_tasks.c.sku_id,
+        canceled_tasks.c.stock,
+        canceled_tasks.c.item_id,
+        literal(id.id, SQLAlchemyUUID(as_uuid=True)))
+    stmt_new_task = insert(task).from_select(
+        ["id", "status", "created_at", "type", "process_id", "sku_id", "stock", "item_id", "posting_id"],
+        query_return).add_cte(canceled_tasks)
+    await session.execute(stmt_new_task)
+    await publish(session, [make_event("posting", id.id, status="canceled")])
     await session.commit()
+    posting_cache.invalidate(id.id)
 
     return {"id": id.id}
-
@@ -1,10 +1,26 @@
+import json
 import uuid
-from fastapi import HTTPException, Depends, APIRouter
-from sqlalchemy import select, label, func
+from typing import Optional
+from fastapi import HTTPException, Depends, APIRouter, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, cast, any_, Float
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_async_session
-from models import sku, stock_table, discount
-from schemas import NewPriceRequest, MarkDownRequest, RequestId, RequestHidden
+from database import get_async_session, get_async_read_session, open_read_session, reads_from_primary
+from models import sku, stock_table
+from schemas import NewPriceRequest, MarkDownRequest, MarkDownBatchRequest, RequestId, RequestIds, RequestHidden, \
+    SkuPriceRow
+from services.cache import sku_info_cache, item_info_cache, items_by_sku_cache, invalidate_skus, invalidate_items, \
+    broadcast_invalidation
+from services.jobs import enqueue_job
+from services.pricing import reprice_items, create_price_import, copy_price_rows, apply_price_import
+from services.queries import sku_info_query, items_by_sku_query
+from services.streaming import MAX_REPORTED_ERRORS, RowErrors, iter_valid_rows, stream_format
+
+ITEMS_PAGE_SIZE = 1000
+ITEMS_STREAM_BATCH = 1000
+PRICE_IMPORT_CHUNK_SIZE = 10000
 
 router = APIRouter(
     tags=["SkuController"]
@@ -12,7 +28,11 @@ router = APIRouter(
 
 
 @router.get("/getItemInfo")
-async def get_item_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+async def get_item_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_read_session)):
+
+    cached = await item_info_cache.get(id)
+    if cached is not None:
+        return cached
 
     query = select(stock_table.c.id, stock_table.c.sku_id, stock_table.c.stock, stock_table.c.reserved_state) \
         .where(stock_table.c.id == id)
@@ -22,106 +42,194 @@ async def get_item_info(id: uuid.UUID, session: AsyncSession = Depends(get_async
     if len(result_info) == 0:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    return result_info[0]
+    response_data = jsonable_encoder(dict(result_info[0]))
+    await item_info_cache.set(id, response_data)
+    return response_data
 
 
 @router.get("/getSkuInfo")
-async def get_sku_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+async def get_sku_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_read_session)):
 
-    query = select(sku.c.id, sku.c.created_at, func.sum(stock_table.c.actual_price).label('actual_price'),
-                   sku.c.base_price, func.count(stock_table.c.id).label('count'), sku.c.is_hidden)\
-        .join(stock_table, stock_table.c.sku_id == sku.c.id).where(sku.c.id == id)\
-        .group_by(sku.c.id)
-    result = await session.execute(query)
+    cached = await sku_info_cache.get(id)
+    if cached is not None:
+        return cached
+
+    result = await session.execute(sku_info_query(sku.c.id == id))
     result_info = result.mappings().all()
 
     if len(result_info) == 0:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    return result_info[0]
+    response_data = jsonable_encoder(dict(result_info[0]))
+    await sku_info_cache.set(id, response_data)
+    return response_data
 
 
-@router.get("/getItemInfoBySkuId")
-async def get_item_info_by_sku_id(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+@router.post("/getItemInfoBatch")
+async def get_item_info_batch(request: RequestIds, session: AsyncSession = Depends(get_async_session)):
 
-    query = select(label('item_id', stock_table.c.id), stock_table.c.stock, stock_table.c.reserved_state) \
-        .where(stock_table.c.sku_id == id)
+    query = select(stock_table.c.id, stock_table.c.sku_id, stock_table.c.stock, stock_table.c.reserved_state) \
+        .where(stock_table.c.id == any_(cast(request.ids, ARRAY(SQLAlchemyUUID(as_uuid=True)))))
     result = await session.execute(query)
+    found = {row.id: jsonable_encoder(dict(row)) for row in result.mappings().all()}
+
+    return {"results": {str(item_id): found.get(item_id) for item_id in request.ids},
+            "not_found": [item_id for item_id in request.ids if item_id not in found]}
+
+
+@router.post("/getSkuInfoBatch")
+async def get_sku_info_batch(request: RequestIds, session: AsyncSession = Depends(get_async_session)):
+
+    sku_ids = cast(request.ids, ARRAY(SQLAlchemyUUID(as_uuid=True)))
+    result = await session.execute(sku_info_query(sku.c.id == any_(sku_ids)))
+    found = {row.id: jsonable_encoder(dict(row)) for row in result.mappings().all()}
+
+    return {"results": {str(sku_id): found.get(sku_id) for sku_id in request.ids},
+            "not_found": [sku_id for sku_id in request.ids if sku_id not in found]}
+
+
+@router.get("/getItemInfoBySkuId")
+async def get_item_info_by_sku_id(id: uuid.UUID, request: Request, stock: Optional[str] = None,
+                                  reserved_state: Optional[bool] = None, cursor: Optional[uuid.UUID] = None,
+                                  limit: int = Query(default=ITEMS_PAGE_SIZE, ge=1, le=10000),
+                                  stream: bool = False,
+                                  session: AsyncSession = Depends(get_async_read_session)):
+
+    query = items_by_sku_query(id, stock, reserved_state, cursor)
+
+    if stream:
+        return StreamingResponse(_stream_items(query, reads_from_primary(request)), media_type="application/x-ndjson")
+
+    # Only the unfiltered first page is cached, keyed by sku id, so that
+    # invalidate_skus keeps covering it.
+    cacheable = stock is None and reserved_state is None and cursor is None and limit == ITEMS_PAGE_SIZE
+    if cacheable:
+        cached = await items_by_sku_cache.get(id)
+        if cached is not None:
+            return cached
+
+    result = await session.execute(query.limit(limit + 1))
     result_info = result.mappings().all()
 
-    if len(result_info) == 0:
+    if len(result_info) == 0 and cursor is None and stock is None and reserved_state is None:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    return {"items": result_info}
+    next_cursor = None
+    if len(result_info) > limit:
+        result_info = result_info[:limit]
+        next_cursor = result_info[-1].item_id
+
+    response_data = jsonable_encoder({"items": [dict(item) for item in result_info], "next_cursor": next_cursor})
+    if cacheable:
+        await items_by_sku_cache.set(id, response_data)
+    return response_data
+
+
+async def _stream_items(query, primary: bool):
+    # Server-side cursor in its own session: the request session is closed
+    # before a streaming body is sent.
+    async with await open_read_session(primary) as session:
+        result = await session.stream(query.execution_options(yield_per=ITEMS_STREAM_BATCH))
+        async for partition in result.mappings().partitions():
+            yield "".join(json.dumps(jsonable_encoder(dict(item))) + "\n" for item in partition)
 
 
 @router.post("/markdownItem")
 async def mark_down_item(request: MarkDownRequest, session: AsyncSession = Depends(get_async_session)):
 
-    query = select(stock_table, sku).join(sku, sku.c.id == stock_table.c.sku_id).where(stock_table.c.id == request.id)
-    result = await session.execute(query)
-    result_info = result.mappings().all()
+    update_markdown = stock_table.update().values(markdown=request.percentage, stock="defect") \
+        .where(stock_table.c.id == request.id) \
+        .returning(stock_table.c.sku_id)
+    result = await session.execute(update_markdown)
+    sku_id = result.scalar()
 
-    if len(result_info) == 0:
+    if sku_id is None:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    update_price = stock_table.update().values(markdown=request.percentage).where(stock_table.c.id == request.id)
-    await session.execute(update_price)
+    await reprice_items(session, stock_table.c.id == request.id)
+    await broadcast_invalidation(session, [request.id], [sku_id])
     await session.commit()
+    await invalidate_items([request.id], [sku_id])
 
-    query_check = select(stock_table, sku.c.base_price, discount.c.percentage) \
-        .join(sku, sku.c.id == stock_table.c.sku_id) \
-        .join(discount, discount.c.id == sku.c.active_discount, isouter=True)\
-        .where(stock_table.c.id == request.id)
-    result = await session.execute(query_check)
-    item_list = result.mappings().all()
-
-    if item_list[0].percentage is None:
-        discount_check: float = 0
-    else:
-        discount_check = item_list[0].percentage
-    new_actual_price = round(item_list[0].base_price * min((1 - discount_check), (1 - item_list[0].markdown)), 2)
-    update_discount_info = stock_table.update().values(actual_price=new_actual_price, stock="defect") \
-        .where(stock_table.c.id == item_list[0].id)
-    await session.execute(update_discount_info)
+    return {"status": "Success set markdown"}
+
+
+@router.post("/markdownItems")
+async def mark_down_items(request: MarkDownBatchRequest, session: AsyncSession = Depends(get_async_session)):
+
+    percentages = {item.id: item.percentage for item in request.items}
+    item_ids = cast(list(percentages.keys()), ARRAY(SQLAlchemyUUID(as_uuid=True)))
+    markdowns = func.unnest(item_ids, cast(list(percentages.values()), ARRAY(Float))) \
+        .table_valued("id", "percentage").render_derived("markdowns")
+
+    update_markdown = stock_table.update().values(markdown=markdowns.c.percentage, stock="defect") \
+        .where(stock_table.c.id == markdowns.c.id) \
+        .returning(stock_table.c.id, stock_table.c.sku_id)
+    result = await session.execute(update_markdown)
+    updated = result.mappings().all()
+    updated_ids = {item.id for item in updated}
+
+    if len(updated_ids) != len(percentages):
+        await session.rollback()
+        raise HTTPException(status_code=404, detail={"message": "Some ID not found",
+                                                     "ids": [str(i) for i in percentages if i not in updated_ids]})
+
+    await reprice_items(session, stock_table.c.id == any_(item_ids))
+    await broadcast_invalidation(session, updated_ids, {item.sku_id for item in updated})
     await session.commit()
+    await invalidate_items(updated_ids, {item.sku_id for item in updated})
 
-    return {"status": "Success set markdown"}
+    return {"status": "Success set markdown", "count": len(updated_ids)}
 
 
 @router.post("/setSkuPrice")
 async def set_sku_price(request: NewPriceRequest, session: AsyncSession = Depends(get_async_session)):
 
-    query = select(sku.c.id).where(sku.c.id == request.sku_id)
-    result = await session.execute(query)
+    update_base_price = sku.update().values(base_price=request.base_price) \
+        .where(sku.c.id == request.sku_id) \
+        .returning(sku.c.id)
+    result = await session.execute(update_base_price)
 
     if result.scalar() is None:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    update_base_price = sku.update().values(base_price=request.base_price).where(sku.c.id == request.sku_id)
-    await session.execute(update_base_price)
+    await reprice_items(session, sku.c.id == request.sku_id)
+    await broadcast_invalidation(session, [], [request.sku_id])
     await session.commit()
+    await invalidate_skus([request.sku_id])
 
-    query_check = select(stock_table, sku.c.base_price, discount.c.percentage) \
-        .join(sku, sku.c.id == stock_table.c.sku_id) \
-        .join(discount, discount.c.id == sku.c.active_discount, isouter=True) \
-        .where(sku.c.id == request.sku_id)
-    result = await session.execute(query_check)
-    item_list = result.mappings().all()
-
-    if item_list[0].percentage is None:
-        discount_check: float = 0
-    else:
-        discount_check = item_list[0].percentage
-    for c in range(len(item_list)):
-        new_actual_price = round(
-            item_list[c].base_price * min((1 - discount_check), (1 - item_list[c].markdown)), 2)
-        update_discount_info = stock_table.update().values(actual_price=new_actual_price) \
-            .where(stock_table.c.id == item_list[c].id)
-        await session.execute(update_discount_info)
+    return {"status": "Success set sku price"}
+
+
+@router.post("/importSkuPrices")
+async def import_sku_prices(request: Request, background: bool = False,
+                            session: AsyncSession = Depends(get_async_session)):
+
+    await create_price_import(session)
+
+    chunk = []
+    row_count = 0
+    errors = RowErrors()
+
+    async for line_number, row in iter_valid_rows(request.stream(), stream_format(request), SkuPriceRow, errors):
+        chunk.append((line_number, row.sku_id, row.base_price))
+        row_count += 1
+        if len(chunk) >= PRICE_IMPORT_CHUNK_SIZE:
+            await copy_price_rows(session, chunk)
+            chunk = []
+    await copy_price_rows(session, chunk)
+
+    response_data = await apply_price_import(session, MAX_REPORTED_ERRORS, reprice=not background)
+    sku_ids = response_data.pop("sku_ids")
+    if background:
+        response_data["job_id"] = await enqueue_job(session, "reprice_skus",
+                                                    {"sku_ids": [str(sku_id) for sku_id in sku_ids]})
+    await broadcast_invalidation(session, [], sku_ids)
     await session.commit()
+    await invalidate_skus(sku_ids)
 
-    return {"status": "Success set sku price"}
+    response_data.update({"rows": row_count, **errors.as_dict()})
+    return response_data
 
 
 @router.post("/toggleIsHidden")
@@ -134,7 +242,9 @@ async def toggle_is_hidden(id: RequestHidden, session: AsyncSession = Depends(ge
         raise HTTPException(status_code=404, detail="ID not found or already hidden")
     update_hidden = sku.update().values(is_hidden=id.is_hidden).where(sku.c.id == id.id)
     await session.execute(update_hidden)
+    await broadcast_invalidation(session, [], [id.id])
     await session.commit()
+    await invalidate_skus([id.id])
 
     return {"status": "Success hidden"}
 
@@ -142,14 +252,17 @@ async def toggle_is_hidden(id: RequestHidden, session: AsyncSession = Depends(ge
 @router.post("/moveToNotFound")
 async def move_to_not_found(id: RequestId, session: AsyncSession = Depends(get_async_session)):
 
-    query = select(stock_table.c.id).where(stock_table.c.id == id.id, stock_table.c.stock != "NotFound")
-    result = await session.execute(query)
+    update_price = stock_table.update().values(stock="NotFound") \
+        .where(stock_table.c.id == id.id, stock_table.c.stock != "NotFound") \
+        .returning(stock_table.c.sku_id)
+    result = await session.execute(update_price)
+    sku_id = result.scalar()
 
-    if result.scalar() is None:
+    if sku_id is None:
         raise HTTPException(status_code=404, detail="ID not found or already move to NotFound")
 
-    update_price = stock_table.update().values(stock="NotFound").where(stock_table.c.id == id.id)
-    await session.execute(update_price)
+    await broadcast_invalidation(session, [id.id], [sku_id])
     await session.commit()
+    await invalidate_items([id.id], [sku_id])
 
     return {"status": "Success move to NotFound"}
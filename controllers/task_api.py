@@ -1,20 +1,39 @@
+import asyncio
+import base64
+import time
 import uuid
 from datetime import datetime
-import random
-from fastapi import HTTPException, Depends, APIRouter
-from sqlalchemy import select, insert
+from typing import Optional
+from fastapi import HTTPException, Depends, APIRouter, Query
+from sqlalchemy import select, cast, any_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_async_session
-from models import task, stock_table, sku, posting
-from schemas import RequestTask
+from database import get_async_session, get_async_read_session
+from models import task
+from config import TASK_POLL_INTERVAL
+from schemas import RequestTask, RequestTasks, RequestIds, ClaimTasksRequest
+from services.cache import posting_cache, invalidate_items, broadcast_invalidation
+from services.queries import tasks_query
+from services.tasks import finish_tasks, claim_tasks
 
 router = APIRouter(
     tags=["TaskApi"]
 )
 
 
+def _task_response(task_info) -> dict:
+    return {
+        "id": str(task_info.id),
+        "status": str(task_info.status),
+        "created_at": str(task_info.created_at),
+        "type": str(task_info.type),
+        "task_target": {"stock": str(task_info.stock), "id": str(task_info.item_id)},
+        "posting_id": str(task_info.posting_id)
+    }
+
+
 @router.get("/getTaskInfo")
-async def get_task_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+async def get_task_info(id: uuid.UUID, session: AsyncSession = Depends(get_async_read_session)):
 
     query = select(task).where(task.c.id == id)
     result = await session.execute(query)
@@ -23,151 +42,94 @@ async def get_task_info(id: uuid.UUID, session: AsyncSession = Depends(get_async
     if len(result_info) == 0:
         raise HTTPException(status_code=404, detail="ID not found")
 
-    response_data = {
-        "id": str(result_info[0].id),
-        "status": str(result_info[0].status),
-        "created_at": str(result_info[0].created_at),
-        "type": str(result_info[0].type),
-        "task_target": {"stock": str(result_info[0].stock), "id": str(result_info[0].item_id)},
-        "posting_id": str(result_info[0].posting_id)
-    }
+    return _task_response(result_info[0])
 
-    return response_data
 
+@router.post("/getTaskInfoBatch")
+async def get_task_info_batch(request: RequestIds, session: AsyncSession = Depends(get_async_session)):
 
-@router.post("/finishTask")
-async def finish_task(id: RequestTask, session: AsyncSession = Depends(get_async_session)):
-
-    query = select(task).where(task.c.id == id.id, task.c.status == "in_work")
+    query = select(task).where(task.c.id == any_(cast(request.ids, ARRAY(SQLAlchemyUUID(as_uuid=True)))))
     result = await session.execute(query)
-    result_info = result.mappings().all()
+    found = {row.id: _task_response(row) for row in result.mappings().all()}
 
-    if len(result_info) == 0:
-        raise HTTPException(status_code=404, detail="id not found or already completed or canceled")
+    return {"results": {str(task_id): found.get(task_id) for task_id in request.ids},
+            "not_found": [task_id for task_id in request.ids if task_id not in found]}
 
-    query_item_id = select(stock_table).where(stock_table.c.id == result_info[0].item_id)
-    result = await session.execute(query_item_id)
-    result_item_info = result.mappings().all()
-
-    check_new_task_create: bool = False
-
-    if id.status == "completed" and result_info[0].type == "placing":
-        if len(result_item_info) == 0:
-            query_sku = select(sku).where(sku.c.id == result_info[0].sku_id)
-            result_sku = await session.execute(query_sku)
-            result_sku_check = result_sku.mappings().all()
-            if len(result_sku_check) == 0:
-                price_check: float = 0.00
-                smtm_sku = insert(sku).values([
-                    result_info[0].sku_id,
-                    price_check,
-                    datetime.utcnow(),
-                    None,
-                    False])
-                await session.execute(smtm_sku)
-            else:
-                price_check: float = result_sku_check[0].base_price
-            stmt_stock = insert(stock_table).values([
-                result_info[0].item_id,
-                result_info[0].sku_id,
-                result_info[0].stock,
-                datetime.utcnow(),
-                False,
-                price_check,
-                False,
-                0.00])
-            await session.execute(stmt_stock)
-            update_stmt = task.update().values(status="completed").where(task.c.id == id.id)
-            await session.execute(update_stmt)
-        else:
-            update_reserved = stock_table.update().values(reserved_state=False)\
-                .where(stock_table.c.id == result_item_info[0].id)
-            await session.execute(update_reserved)
-        update_stmt = task.update().values(status="completed").where(task.c.id == id.id)
-        await session.execute(update_stmt)
-
-    if id.status == "canceled" and result_info[0].type == "placing":
-        update_stmt = task.update().values(status="canceled").where(task.c.id == id.id)
-        await session.execute(update_stmt)
-
-    if id.status == "canceled" and result_info[0].type == "picking":
-        update_reserved = stock_table.update().values(reserved_state=False)\
-            .where(stock_table.c.id == result_item_info[0].id)
-        await session.execute(update_reserved)
-        update_stmt = task.update().values(status="canceled").where(task.c.id == id.id)
-        await session.execute(update_stmt)
-
-    if id.status == "completed" and result_info[0].type == "picking":
-        if random.random() < 0.1:
-            update_price = stock_table.update()\
-                .values(stock="NotFound").where(stock_table.c.id == result_item_info[0].id)
-            await session.execute(update_price)
-            await session.commit()
-        query_notfound_check = select(stock_table)\
-            .where(stock_table.c.id == result_info[0].item_id, stock_table.c.stock != "NotFound")
-        result = await session.execute(query_notfound_check)
-        result_notfound_check = result.mappings().all()
-        if len(result_notfound_check) == 0:
-            query_new_found_check = select(stock_table) \
-                .where(stock_table.c.sku_id == result_info[0].sku_id,
-                       stock_table.c.stock == result_info[0].stock,
-                       stock_table.c.reserved_state.is_(False))\
-                .limit(1)
-            result = await session.execute(query_new_found_check)
-            result_new_found_check = result.mappings().all()
-            if len(result_new_found_check) == 0:
-                stmt_new_task = insert(task).values([
-                    uuid.uuid4(),
-                    "in_work", datetime.utcnow(),
-                    "picking", None,
-                    result_new_found_check[0].sku_id,
-                    result_new_found_check[0].stock,
-                    result_new_found_check[0].id,
-                    result_info[0].posting_id])
-                await session.execute(stmt_new_task)
-            check_new_task_create = True
-
-    if check_new_task_create is True:
-        status_result = "canceled"
-    else:
-        status_result = id.status
-    update_stmt = task.update().values(status=status_result).where(task.c.id == id.id)
-    await session.execute(update_stmt)
-    await session.commit()
 
-    query_posting_check = select(task).where(task.c.posting_id == result_info[0].posting_id,
-                                             task.c.status == "in_work")
-    result = await session.execute(query_posting_check)
-    result_posting_check = result.mappings().all()
+def _encode_cursor(created_at: datetime, task_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{task_id}".encode()).decode()
 
-    query_posting_finish = select(task).where(task.c.posting_id == result_info[0].posting_id,
-                                              task.c.status == "completed")
-    result = await session.execute(query_posting_finish)
-    result_posting_finish = result.mappings().all()
 
-    if len(result_posting_check) == 0 and len(result_posting_finish) != 0:
-        update_stmt = posting.update().values(status="sent").where(posting.c.id == result_info[0].posting_id)
-        await session.execute(update_stmt)
-        await session.commit()
+def _decode_cursor(cursor: str):
+    try:
+        created_at, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(task_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    if len(result_posting_check) == 0 and len(result_posting_finish) == 0:
-        update_stmt = posting.update().values(status="canceled").where(posting.c.id == result_info[0].posting_id)
-        await session.execute(update_stmt)
-        await session.commit()
 
-    return {"id": id.id, "status": status_result}
+@router.get("/getTasks")
+async def get_tasks(status: Optional[str] = None, type: Optional[str] = None,
+                    sku_id: Optional[uuid.UUID] = None, process_id: Optional[uuid.UUID] = None,
+                    posting_id: Optional[uuid.UUID] = None,
+                    created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                    cursor: Optional[str] = None, limit: int = Query(default=100, ge=1, le=1000),
+                    session: AsyncSession = Depends(get_async_read_session)):
 
+    after = _decode_cursor(cursor) if cursor is not None else None
+    result = await session.execute(tasks_query(limit, status, type, sku_id, process_id, posting_id,
+                                               created_from, created_to, after))
+    result_info = result.mappings().all()
 
+    next_cursor = None
+    if len(result_info) > limit:
+        result_info = result_info[:limit]
+        next_cursor = _encode_cursor(result_info[-1].created_at, result_info[-1].id)
 
+    return {"tasks": result_info, "next_cursor": next_cursor}
 
 
+@router.post("/finishTask")
+async def finish_task(id: RequestTask, session: AsyncSession = Depends(get_async_session)):
 
+    finished = await finish_tasks(session, {id.id: id.status})
 
+    if id.id not in finished.statuses:
+        raise HTTPException(status_code=404, detail="id not found or already completed or canceled")
 
+    await broadcast_invalidation(session, finished.item_ids, finished.sku_ids)
+    await session.commit()
+    for posting_id in finished.posting_ids:
+        posting_cache.invalidate(posting_id)
+    await invalidate_items(finished.item_ids, finished.sku_ids)
+
+    return {"id": id.id, "status": finished.statuses[id.id]}
 
 
+@router.post("/finishTasks")
+async def finish_tasks_batch(request: RequestTasks, session: AsyncSession = Depends(get_async_session)):
 
+    statuses = {item.id: item.status for item in request.tasks}
+    finished = await finish_tasks(session, statuses)
+    await broadcast_invalidation(session, finished.item_ids, finished.sku_ids)
+    await session.commit()
+    for posting_id in finished.posting_ids:
+        posting_cache.invalidate(posting_id)
+    await invalidate_items(finished.item_ids, finished.sku_ids)
 
+    return {"tasks": [{"id": task_id, "status": status} for task_id, status in finished.statuses.items()],
+            "not_found": [task_id for task_id in statuses if task_id not in finished.statuses]}
 
 
+@router.post("/claimTasks")
+async def claim_next_tasks(request: ClaimTasksRequest, session: AsyncSession = Depends(get_async_session)):
+
+    deadline = time.monotonic() + request.wait
+    while True:
+        claimed = await claim_tasks(session, request.worker_id, request.type, request.limit)
+        await session.commit()
+        if len(claimed) != 0 or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(min(TASK_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
 
+    return {"tasks": claimed}
@@ -1,19 +1,127 @@
-from typing import AsyncGenerator
+import asyncio
+import itertools
+import logging
+import time
+from typing import AsyncGenerator, Dict
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER, DB_REPLICA_HOSTS, REPLICA_CONNECT_TIMEOUT, \
+    REPLICA_RETRY_INTERVAL, READ_YOUR_WRITES_WINDOW, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, \
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+REPLICA_URLS = [f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{host}/{DB_NAME}" for host in DB_REPLICA_HOSTS]
+READ_PRIMARY_HEADER = "X-Read-Primary"
+READ_PRIMARY_COOKIE = "read_primary"
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
 
-engine = create_async_engine(DATABASE_URL)
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_async_engine(DATABASE_URL, **POOL_OPTIONS)
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+replica_engines = [create_async_engine(url, connect_args={"timeout": REPLICA_CONNECT_TIMEOUT}, **POOL_OPTIONS)
+                   for url in REPLICA_URLS]
+_replica_order = itertools.cycle(range(len(replica_engines)))
+_replica_down_until: Dict[int, float] = {}
+
+
+class ReplicaSession(AsyncSession):
+    # Picks its database on the first statement, so a request answered from
+    # a cache never checks out a connection. Replicas are tried round-robin;
+    # one that fails to connect is skipped for REPLICA_RETRY_INTERVAL, and
+    # the session falls back to the primary when no replica is reachable.
+    _bound = False
+
+    async def _bind_database(self) -> None:
+        if self._bound:
+            return
+        self._bound = True
+        for _ in range(len(replica_engines)):
+            index = next(_replica_order)
+            if _replica_down_until.get(index, 0) > time.monotonic():
+                continue
+            self.sync_session.bind = replica_engines[index].sync_engine
+            try:
+                await self.connection()
+                return
+            except (DBAPIError, OSError, asyncio.TimeoutError):
+                logger.warning("Replica %s is unreachable, skipping it", DB_REPLICA_HOSTS[index])
+                _replica_down_until[index] = time.monotonic() + REPLICA_RETRY_INTERVAL
+                await self.close()
+        self.sync_session.bind = engine.sync_engine
+
+    async def execute(self, *args, **kwargs):
+        await self._bind_database()
+        return await super().execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        await self._bind_database()
+        return await super().scalar(*args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        await self._bind_database()
+        return await super().stream(*args, **kwargs)
+
+
+replica_session_maker = sessionmaker(class_=ReplicaSession, expire_on_commit=False)
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
+
+def reads_from_primary(request: Request) -> bool:
+    # Clients see their own writes either by asking for the primary
+    # explicitly or through the cookie set after every successful write.
+    return request.headers.get(READ_PRIMARY_HEADER) is not None or READ_PRIMARY_COOKIE in request.cookies
+
+
+class ReadYourWritesMiddleware:
+    # Sets the read-primary cookie on successful writes. Plain ASGI rather
+    # than @app.middleware("http"): that one runs every endpoint in a separate
+    # task and re-streams each response body through a memory channel.
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.enabled = len(replica_engines) != 0 and READ_YOUR_WRITES_WINDOW > 0
+        self.cookie = f"{READ_PRIMARY_COOKIE}=1; HttpOnly; Max-Age={READ_YOUR_WRITES_WINDOW}; Path=/; SameSite=lax"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http" or scope["method"] in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("set-cookie", self.cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+async def open_read_session(primary: bool = False) -> AsyncSession:
+    if primary or len(replica_engines) == 0:
+        return async_session_maker()
+    return replica_session_maker()
+
+
+async def get_async_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with await open_read_session(reads_from_primary(request)) as session:
+        yield session
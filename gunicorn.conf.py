@@ -0,0 +1,15 @@
+from config import WEB_CONCURRENCY, MAX_REQUESTS, MAX_REQUESTS_JITTER, GRACEFUL_TIMEOUT
+
+bind = "0.0.0.0:8000"
+workers = WEB_CONCURRENCY
+worker_class = "workers.Worker"
+
+# Workers are restarted after a jittered number of requests so they do not
+# all recycle at once; in-flight requests get GRACEFUL_TIMEOUT to finish.
+max_requests = MAX_REQUESTS
+max_requests_jitter = MAX_REQUESTS_JITTER
+graceful_timeout = GRACEFUL_TIMEOUT
+timeout = GRACEFUL_TIMEOUT * 2
+
+# Every worker must build its own engine and pool after the fork.
+preload_app = False
@@ -1,22 +1,50 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from controllers.posting_api import router as posting_controller
 from controllers.task_api import router as taskapi
 from controllers.discount_api import router as discountapi
 from controllers.sku_api import router as sku_controller
 from controllers.acceptance_api import router as acceptance_controller
-from database import get_async_session
+from controllers.events_api import router as events_controller
+from controllers.job_api import router as job_controller
+from controllers.cache_api import router as cache_controller
+from database import get_async_session, ReadYourWritesMiddleware, engine, replica_engines
 from models import acceptance, task, stock_table, discount, sku, posting
+from services.events import broker
+from services.scheduler import discount_scheduler, stock_counter_compactor
+from services.jobs import job_runner
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    broker.start()
+    discount_scheduler.start()
+    stock_counter_compactor.start()
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    await stock_counter_compactor.stop()
+    await discount_scheduler.stop()
+    await broker.stop()
+    for pool in [engine, *replica_engines]:
+        await pool.dispose()
+
+
 app = FastAPI(
-    title="Tochka.Univermag 2.0"
+    title="Tochka.Univermag 2.0",
+    lifespan=lifespan
 )
 
+app.add_middleware(ReadYourWritesMiddleware)
+
 app.include_router(posting_controller)
 app.include_router(taskapi)
 app.include_router(discountapi)
 app.include_router(sku_controller)
 app.include_router(acceptance_controller)
+app.include_router(events_controller)
+app.include_router(job_controller)
+app.include_router(cache_controller)
 
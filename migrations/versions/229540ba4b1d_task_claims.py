@@ -0,0 +1,31 @@
+"""Task claims
+
+Revision ID: 229540ba4b1d
+Revises: 9b1b0c6071a8
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '229540ba4b1d'
+down_revision: Union[str, None] = '9b1b0c6071a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('task', sa.Column('claimed_by', sa.String(), nullable=True))
+    op.add_column('task', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_task_queue', 'task', ['type', 'created_at'],
+                    postgresql_where=sa.text("status = 'in_work'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_queue', table_name='task')
+    op.drop_column('task', 'claimed_at')
+    op.drop_column('task', 'claimed_by')
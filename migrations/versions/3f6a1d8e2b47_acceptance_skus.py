@@ -0,0 +1,36 @@
+"""Acceptance skus
+
+Revision ID: 3f6a1d8e2b47
+Revises: 8c4e2d7a9f10
+Create Date: 2026-10-18 18:05:31.640227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6a1d8e2b47'
+down_revision: Union[str, None] = '8c4e2d7a9f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('acceptance_sku',
+    sa.Column('acceptance_id', sa.UUID(), nullable=False),
+    sa.Column('sku_id', sa.UUID(), nullable=False),
+    sa.Column('stock', sa.String(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('acceptance_id', 'sku_id', 'stock')
+    )
+    op.execute("INSERT INTO acceptance_sku (acceptance_id, sku_id, stock, count) "
+               "SELECT task.process_id, task.sku_id, task.stock, count(*) FROM task "
+               "JOIN acceptance ON acceptance.id = task.process_id "
+               "GROUP BY task.process_id, task.sku_id, task.stock")
+
+
+def downgrade() -> None:
+    op.drop_table('acceptance_sku')
@@ -0,0 +1,42 @@
+"""Hot query indexes
+
+Revision ID: 5e0f3a9c7d21
+Revises: dfb84a57b992
+Create Date: 2026-10-18 16:21:09.482113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0f3a9c7d21'
+down_revision: Union[str, None] = 'dfb84a57b992'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_stock_table_sku_id_id', 'stock_table', ['sku_id', 'id'])
+    op.create_index('ix_stock_table_free', 'stock_table', ['sku_id', 'stock', 'created_at', 'id'],
+                    postgresql_where=sa.text("reserved_state IS false"))
+    op.create_index('ix_sku_active_discount', 'sku', ['active_discount'],
+                    postgresql_where=sa.text("active_discount IS NOT NULL"))
+    op.create_index('ix_task_process_id_id', 'task', ['process_id', 'id'])
+    op.create_index('ix_discount_scheduled_starts_at', 'discount', ['starts_at'],
+                    postgresql_where=sa.text("status = 'scheduled'"))
+    op.create_index('ix_discount_open_ends_at', 'discount', ['ends_at'],
+                    postgresql_where=sa.text("status IN ('active', 'scheduled')"))
+    op.create_index('ix_discount_sku_sku_id', 'discount_sku', ['sku_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_discount_sku_sku_id', table_name='discount_sku')
+    op.drop_index('ix_discount_open_ends_at', table_name='discount')
+    op.drop_index('ix_discount_scheduled_starts_at', table_name='discount')
+    op.drop_index('ix_task_process_id_id', table_name='task')
+    op.drop_index('ix_sku_active_discount', table_name='sku')
+    op.drop_index('ix_stock_table_free', table_name='stock_table')
+    op.drop_index('ix_stock_table_sku_id_id', table_name='stock_table')
@@ -0,0 +1,36 @@
+"""Scheduled discounts
+
+Revision ID: 71d31862e951
+Revises: c28a32c1038b
+Create Date: 2026-10-18 12:20:05.118464
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '71d31862e951'
+down_revision: Union[str, None] = 'c28a32c1038b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('discount', sa.Column('starts_at', sa.DateTime(), nullable=True))
+    op.add_column('discount', sa.Column('ends_at', sa.DateTime(), nullable=True))
+    op.create_table('discount_sku',
+    sa.Column('discount_id', sa.UUID(), nullable=False),
+    sa.Column('sku_id', sa.UUID(), nullable=False),
+    sa.PrimaryKeyConstraint('discount_id', 'sku_id')
+    )
+    op.execute("INSERT INTO discount_sku (discount_id, sku_id) "
+               "SELECT active_discount, id FROM sku WHERE active_discount IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.drop_table('discount_sku')
+    op.drop_column('discount', 'ends_at')
+    op.drop_column('discount', 'starts_at')
@@ -0,0 +1,37 @@
+"""Job leases
+
+Revision ID: 8c4e2d7a9f10
+Revises: 5e0f3a9c7d21
+Create Date: 2026-10-18 17:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2d7a9f10'
+down_revision: Union[str, None] = '5e0f3a9c7d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('job', sa.Column('locked_by', sa.UUID(), nullable=True))
+    op.add_column('job', sa.Column('locked_until', sa.DateTime(), nullable=True))
+    # claim_job takes queued jobs and expired running ones in created_at
+    # order; one index serves both without a sort.
+    op.drop_index('ix_job_queued', table_name='job')
+    op.create_index('ix_job_claimable', 'job', ['created_at'],
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+    # Jobs left running by the previous code have no lease to expire.
+    op.execute("UPDATE job SET status = 'queued' WHERE status = 'running'")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_claimable', table_name='job')
+    op.create_index('ix_job_queued', 'job', ['created_at'], postgresql_where=sa.text("status = 'queued'"))
+    op.drop_column('job', 'locked_until')
+    op.drop_column('job', 'locked_by')
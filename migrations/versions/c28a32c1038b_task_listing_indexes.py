@@ -0,0 +1,33 @@
+"""Task listing indexes
+
+Revision ID: c28a32c1038b
+Revises: 229540ba4b1d
+Create Date: 2026-10-18 11:02:47.915320
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c28a32c1038b'
+down_revision: Union[str, None] = '229540ba4b1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_task_created_at_id', 'task', ['created_at', 'id'])
+    op.create_index('ix_task_status_created_at_id', 'task', ['status', 'created_at', 'id'])
+    op.create_index('ix_task_sku_id_created_at_id', 'task', ['sku_id', 'created_at', 'id'])
+    op.create_index('ix_task_process_id_created_at_id', 'task', ['process_id', 'created_at', 'id'])
+    op.create_index('ix_task_posting_id_created_at_id', 'task', ['posting_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_posting_id_created_at_id', table_name='task')
+    op.drop_index('ix_task_process_id_created_at_id', table_name='task')
+    op.drop_index('ix_task_sku_id_created_at_id', table_name='task')
+    op.drop_index('ix_task_status_created_at_id', table_name='task')
+    op.drop_index('ix_task_created_at_id', table_name='task')
@@ -0,0 +1,93 @@
+"""SKU stock counters
+
+Revision ID: dfb84a57b992
+Revises: 1b67b2c6b1f1
+Create Date: 2026-10-18 15:07:52.330871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dfb84a57b992'
+down_revision: Union[str, None] = '1b67b2c6b1f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _append_delta(deltas: str) -> str:
+    # Writers only ever append one row per (sku, stock, reserved_state) they
+    # changed, so they never lock counter rows and cannot deadlock on them;
+    # services.stock_counters folds the rows back together in the background.
+    return f"""
+    INSERT INTO sku_stock_counter (sku_id, stock, reserved_state, item_count, price_sum)
+    SELECT sku_id, stock, reserved_state, sum(item_count), sum(price_sum)
+    FROM ({deltas}) AS deltas
+    GROUP BY sku_id, stock, reserved_state
+    HAVING sum(item_count) <> 0 OR sum(price_sum) <> 0;
+    """
+
+
+def _rows(table: str, sign: str) -> str:
+    return f"SELECT sku_id, stock, reserved_state, {sign}1 AS item_count, " \
+           f"{sign}coalesce(actual_price, 0) AS price_sum FROM {table}"
+
+
+def upgrade() -> None:
+    op.create_table('sku_stock_counter',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('sku_id', sa.UUID(), nullable=False),
+    sa.Column('stock', sa.String(), nullable=False),
+    sa.Column('reserved_state', sa.Boolean(), nullable=False),
+    sa.Column('item_count', sa.BigInteger(), nullable=False),
+    sa.Column('price_sum', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sku_stock_counter_key', 'sku_stock_counter', ['sku_id', 'stock', 'reserved_state'])
+    op.execute(f"""
+    CREATE FUNCTION sku_stock_counter_insert() RETURNS trigger AS $$
+    BEGIN
+    {_append_delta(_rows("new_rows", ""))}
+    RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+    """)
+    op.execute(f"""
+    CREATE FUNCTION sku_stock_counter_update() RETURNS trigger AS $$
+    BEGIN
+    {_append_delta(_rows("old_rows", "-") + " UNION ALL " + _rows("new_rows", ""))}
+    RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+    """)
+    op.execute(f"""
+    CREATE FUNCTION sku_stock_counter_delete() RETURNS trigger AS $$
+    BEGIN
+    {_append_delta(_rows("old_rows", "-"))}
+    RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+    """)
+    op.execute("CREATE TRIGGER sku_stock_counter_insert AFTER INSERT ON stock_table "
+               "REFERENCING NEW TABLE AS new_rows "
+               "FOR EACH STATEMENT EXECUTE FUNCTION sku_stock_counter_insert()")
+    op.execute("CREATE TRIGGER sku_stock_counter_update AFTER UPDATE ON stock_table "
+               "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+               "FOR EACH STATEMENT EXECUTE FUNCTION sku_stock_counter_update()")
+    op.execute("CREATE TRIGGER sku_stock_counter_delete AFTER DELETE ON stock_table "
+               "REFERENCING OLD TABLE AS old_rows "
+               "FOR EACH STATEMENT EXECUTE FUNCTION sku_stock_counter_delete()")
+    op.execute("INSERT INTO sku_stock_counter (sku_id, stock, reserved_state, item_count, price_sum) "
+               "SELECT sku_id, stock, reserved_state, count(*), coalesce(sum(actual_price), 0) "
+               "FROM stock_table GROUP BY sku_id, stock, reserved_state")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER sku_stock_counter_delete ON stock_table")
+    op.execute("DROP TRIGGER sku_stock_counter_update ON stock_table")
+    op.execute("DROP TRIGGER sku_stock_counter_insert ON stock_table")
+    op.execute("DROP FUNCTION sku_stock_counter_delete()")
+    op.execute("DROP FUNCTION sku_stock_counter_update()")
+    op.execute("DROP FUNCTION sku_stock_counter_insert()")
+    op.drop_index('ix_sku_stock_counter_key', table_name='sku_stock_counter')
+    op.drop_table('sku_stock_counter')
@@ -1,7 +1,8 @@
 from datetime import datetime
+from typing import Any, Optional
 from pydantic import BaseModel
-from sqlalchemy import Table, Column, String, MetaData, Boolean, Float, DateTime, TIMESTAMP
-from sqlalchemy.dialects.postgresql import UUID as SQLAlchemyUUID
+from sqlalchemy import Table, Column, Index, String, MetaData, Boolean, Float, Integer, BigInteger, DateTime, text
+from sqlalchemy.dialects.postgresql import UUID as SQLAlchemyUUID, JSONB
 from uuid import UUID
 
 
@@ -18,6 +19,8 @@ stock_table: Table = Table(
     Column('actual_price', Float),
     Column('is_hidden', Boolean),
     Column('markdown', Float),
+    Index('ix_stock_table_sku_id_id', 'sku_id', 'id'),
+    Index('ix_stock_table_free', 'sku_id', 'stock', 'created_at', 'id', postgresql_where=text("reserved_state IS false")),
 )
 
 
@@ -36,6 +39,22 @@ class StockTable(BaseModel):
         from_attributes = True
 
 
+# Per-SKU totals of stock_table as a log of deltas, appended by
+# statement-level triggers on stock_table (see the sku_stock_counters
+# migration) and compacted in the background; readers sum the rows.
+sku_stock_counter: Table = Table(
+    "sku_stock_counter",
+    metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=True),
+    Column('sku_id', SQLAlchemyUUID(as_uuid=True), nullable=False),
+    Column('stock', String, nullable=False),
+    Column('reserved_state', Boolean, nullable=False),
+    Column('item_count', BigInteger, nullable=False),
+    Column('price_sum', Float, nullable=False),
+    Index('ix_sku_stock_counter_key', 'sku_id', 'stock', 'reserved_state'),
+)
+
+
 sku: Table = Table(
     "sku",
     metadata,
@@ -44,6 +63,7 @@ sku: Table = Table(
     Column('created_at', DateTime(timezone=False)),
     Column('active_discount', SQLAlchemyUUID(as_uuid=True), nullable=True),
     Column('is_hidden', Boolean),
+    Index('ix_sku_active_discount', 'active_discount', postgresql_where=text("active_discount IS NOT NULL")),
 )
 
 
@@ -71,7 +91,15 @@ task = Table(
     Column('stock', String, nullable=False),
     Column('item_id', SQLAlchemyUUID(as_uuid=True)),
     Column('posting_id', SQLAlchemyUUID(as_uuid=True), nullable=True),
-
+    Column('claimed_by', String, nullable=True),
+    Column('claimed_at', DateTime(timezone=False), nullable=True),
+    Index('ix_task_queue', 'type', 'created_at', postgresql_where=text("status = 'in_work'")),
+    Index('ix_task_created_at_id', 'created_at', 'id'),
+    Index('ix_task_status_created_at_id', 'status', 'created_at', 'id'),
+    Index('ix_task_sku_id_created_at_id', 'sku_id', 'created_at', 'id'),
+    Index('ix_task_process_id_created_at_id', 'process_id', 'created_at', 'id'),
+    Index('ix_task_posting_id_created_at_id', 'posting_id', 'created_at', 'id'),
+    Index('ix_task_process_id_id', 'process_id', 'id'),
 )
 
 
@@ -85,6 +113,8 @@ class Task(BaseModel):
     stock: str
     item_id: UUID
     posting_id: UUID
+    claimed_by: Optional[str]
+    claimed_at: Optional[datetime]
 
     class Config:
         arbitrary_types_allowed = True
@@ -98,6 +128,10 @@ discount = Table(
     Column('status', String),
     Column('created_at', DateTime(timezone=False)),
     Column('percentage', Float),
+    Column('starts_at', DateTime(timezone=False), nullable=True),
+    Column('ends_at', DateTime(timezone=False), nullable=True),
+    Index('ix_discount_scheduled_starts_at', 'starts_at', postgresql_where=text("status = 'scheduled'")),
+    Index('ix_discount_open_ends_at', 'ends_at', postgresql_where=text("status IN ('active', 'scheduled')")),
 )
 
 
@@ -106,6 +140,26 @@ class Discount(BaseModel):
     status: str
     created_at: datetime
     percentage: float
+    starts_at: Optional[datetime]
+    ends_at: Optional[datetime]
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+
+
+discount_sku = Table(
+    "discount_sku",
+    metadata,
+    Column('discount_id', SQLAlchemyUUID(as_uuid=True), primary_key=True),
+    Column('sku_id', SQLAlchemyUUID(as_uuid=True), primary_key=True),
+    Index('ix_discount_sku_sku_id', 'sku_id'),
+)
+
+
+class DiscountSku(BaseModel):
+    discount_id: UUID
+    sku_id: UUID
 
     class Config:
         arbitrary_types_allowed = True
@@ -129,6 +183,29 @@ class Acceptance(BaseModel):
         from_attributes = True
 
 
+# Units accepted per (sku, stock), recorded with the placing tasks so
+# getAcceptanceInfo does not aggregate every task of the acceptance.
+acceptance_sku = Table(
+    "acceptance_sku",
+    metadata,
+    Column('acceptance_id', SQLAlchemyUUID(as_uuid=True), primary_key=True),
+    Column('sku_id', SQLAlchemyUUID(as_uuid=True), primary_key=True),
+    Column('stock', String, primary_key=True),
+    Column('count', BigInteger, nullable=False),
+)
+
+
+class AcceptanceSku(BaseModel):
+    acceptance_id: UUID
+    sku_id: UUID
+    stock: str
+    count: int
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+
+
 posting = Table(
     "posting",
     metadata,
@@ -146,3 +223,41 @@ class Posting(BaseModel):
     class Config:
         arbitrary_types_allowed = True
         from_attributes = True
+
+
+job = Table(
+    "job",
+    metadata,
+    Column('id', SQLAlchemyUUID(as_uuid=True), primary_key=True),
+    Column('type', String, nullable=False),
+    Column('status', String, nullable=False),
+    Column('payload', JSONB, nullable=False),
+    Column('result', JSONB, nullable=True),
+    Column('error', String, nullable=True),
+    Column('progress', Integer, nullable=False),
+    Column('total', Integer, nullable=True),
+    Column('created_at', DateTime(timezone=False), nullable=False),
+    Column('updated_at', DateTime(timezone=False), nullable=False),
+    Column('locked_by', SQLAlchemyUUID(as_uuid=True), nullable=True),
+    Column('locked_until', DateTime(timezone=False), nullable=True),
+    Index('ix_job_claimable', 'created_at', postgresql_where=text("status IN ('queued', 'running')")),
+)
+
+
+class Job(BaseModel):
+    id: UUID
+    type: str
+    status: str
+    payload: Any
+    result: Optional[Any]
+    error: Optional[str]
+    progress: int
+    total: Optional[int]
+    created_at: datetime
+    updated_at: datetime
+    locked_by: Optional[UUID]
+    locked_until: Optional[datetime]
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Optional
 from pydantic import BaseModel, validator
 from uuid import UUID
 
@@ -62,6 +63,8 @@ class SkuidRequest(BaseModel):
 class DiscountRequest(BaseModel):
     sku_ids: List[UUID]
     percentage: float = 0.10
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
 
     @validator('percentage')
     def check_percentage(cls, value):
@@ -69,6 +72,18 @@ class DiscountRequest(BaseModel):
             raise ValueError('Percentage must be positive and must be < 1')
         return value
 
+    @validator('starts_at', 'ends_at')
+    def to_naive_utc(cls, value):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @validator('ends_at')
+    def check_ends_after_start(cls, value, values):
+        if value is not None and values.get('starts_at') is not None and value <= values['starts_at']:
+            raise ValueError('ends_at must be after starts_at')
+        return value
+
     class Config:
         arbitrary_types_allowed = True
         from_attributes = True
@@ -91,6 +106,22 @@ class NewPriceRequest(BaseModel):
         table_valued = True
 
 
+class SkuPriceRow(BaseModel):
+    sku_id: UUID
+    base_price: float
+
+    @validator('base_price')
+    def check_price_non_negative(cls, value):
+        if value < 0:
+            raise ValueError('base_price must be not negative')
+        return value
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+        table_valued = True
+
+
 class MarkDownRequest(BaseModel):
     id: UUID
     percentage: float = 0.10
@@ -107,6 +138,15 @@ class MarkDownRequest(BaseModel):
         table_valued = True
 
 
+class MarkDownBatchRequest(BaseModel):
+    items: List[MarkDownRequest]
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+        table_valued = True
+
+
 class ItemRequest(BaseModel):
     sku: UUID
     from_valid_ids: List[UUID]
@@ -127,10 +167,52 @@ class PostingRequest(BaseModel):
         table_valued = True
 
 
+class ItemQuantityRequest(BaseModel):
+    sku: UUID
+    stock: str = 'valid'
+    quantity: int = 1
+
+    @validator('stock')
+    def check_stock(cls, value):
+        if not value == 'valid' and not value == 'defect':
+            raise ValueError('Stock must be "valid" or "defect"')
+        return value
+
+    @validator('quantity')
+    def check_quantity_positive(cls, value):
+        if value <= 0:
+            raise ValueError('Quantity must be positive')
+        return value
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+        table_valued = True
+
+
+class QuantityPostingRequest(BaseModel):
+    ordered_goods: List[ItemQuantityRequest]
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+        table_valued = True
+
+
 class RequestId(BaseModel):
     id: UUID
 
 
+class RequestIds(BaseModel):
+    ids: List[UUID]
+
+    @validator('ids')
+    def check_ids_count(cls, value):
+        if not 0 < len(value) <= 1000:
+            raise ValueError('Number of ids must be between 1 and 1000')
+        return value
+
+
 class RequestHidden(BaseModel):
     id: UUID
     is_hidden: bool = True
@@ -152,3 +234,40 @@ class RequestTask(BaseModel):
         table_valued = True
 
 
+class RequestTasks(BaseModel):
+    tasks: List[RequestTask]
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+        table_valued = True
+
+
+class ClaimTasksRequest(BaseModel):
+    worker_id: str
+    type: str = "picking"
+    limit: int = 10
+    wait: float = 0
+
+    @validator('type')
+    def check_type(cls, value):
+        if not (value == "placing" or value == "picking"):
+            raise ValueError('Type must be "placing" or "picking"')
+        return value
+
+    @validator('limit')
+    def check_limit(cls, value):
+        if not 0 < value <= 100:
+            raise ValueError('Limit must be positive and must be <= 100')
+        return value
+
+    @validator('wait')
+    def check_wait(cls, value):
+        if not 0 <= value <= 30:
+            raise ValueError('Wait must be between 0 and 30 seconds')
+        return value
+
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+        table_valued = True
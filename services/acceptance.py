@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+from uuid import UUID
+from sqlalchemy import insert, select, cast, literal, null, true, Integer, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from models import task, acceptance_sku
+from schemas import ItemToAccept
+
+
+async def insert_placing_tasks(session: AsyncSession, acceptance_id: UUID, items: List[ItemToAccept]) -> None:
+    # One INSERT ... SELECT per batch: the manifest is sent as three arrays and
+    # expanded into one "placing" task per physical unit by generate_series.
+    if len(items) == 0:
+        return
+
+    manifest = func.unnest(
+        cast([item.sku_id for item in items], ARRAY(SQLAlchemyUUID(as_uuid=True))),
+        cast([item.stock for item in items], ARRAY(String)),
+        cast([item.count for item in items], ARRAY(Integer)),
+    ).table_valued("sku_id", "stock", "count").render_derived("manifest")
+    units = func.generate_series(1, manifest.c.count).table_valued("n").lateral("units")
+
+    query_units = select(
+        func.gen_random_uuid(),
+        literal("in_work"), literal(datetime.utcnow(), DateTime),
+        literal("placing"), literal(acceptance_id, SQLAlchemyUUID(as_uuid=True)),
+        manifest.c.sku_id,
+        manifest.c.stock,
+        func.gen_random_uuid(),
+        null()).select_from(manifest.join(units, true()))
+
+    stmt_insert = insert(task).from_select(
+        ["id", "status", "created_at", "type", "process_id", "sku_id", "stock", "item_id", "posting_id"],
+        query_units)
+    await session.execute(stmt_insert)
+
+    await _count_accepted(session, acceptance_id, items)
+
+
+async def _count_accepted(session: AsyncSession, acceptance_id: UUID, items: List[ItemToAccept]) -> None:
+    # Adds the batch to the per-(sku, stock) totals of the acceptance; lines
+    # repeating a pair are merged first, as one upsert cannot touch a row twice.
+    counts: Dict[Tuple[UUID, str], int] = {}
+    for item in items:
+        counts[(item.sku_id, item.stock)] = counts.get((item.sku_id, item.stock), 0) + item.count
+    batch = func.unnest(
+        cast([key[0] for key in counts], ARRAY(SQLAlchemyUUID(as_uuid=True))),
+        cast([key[1] for key in counts], ARRAY(String)),
+        cast(list(counts.values()), ARRAY(Integer)),
+    ).table_valued("sku_id", "stock", "count").render_derived("batch")
+    query_counts = select(literal(acceptance_id, SQLAlchemyUUID(as_uuid=True)),
+                          batch.c.sku_id, batch.c.stock, batch.c.count).select_from(batch)
+    stmt_insert = pg_insert(acceptance_sku).from_select(["acceptance_id", "sku_id", "stock", "count"], query_counts)
+    stmt_insert = stmt_insert.on_conflict_do_update(
+        index_elements=[acceptance_sku.c.acceptance_id, acceptance_sku.c.sku_id, acceptance_sku.c.stock],
+        set_={"count": acceptance_sku.c.count + stmt_insert.excluded.count})
+    await session.execute(stmt_insert)
@@ -0,0 +1,185 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import POSTING_CACHE_TTL, READ_CACHE_TTL, READ_CACHE_SIZE, REDIS_URL
+from services.events import broker, publish
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+CACHE_CHANNEL = "cache_invalidation"
+KEYS_PER_NOTIFY = 150
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    # In-process cache with per-entry expiry and LRU eviction; ttl <= 0 disables it.
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ReadThroughCache:
+    # Async cache for JSON-serialisable responses. Entries live in the shared
+    # Redis-compatible store when one is configured, in-process otherwise.
+    # Store errors degrade to cache misses.
+
+    def __init__(self, name: str, ttl: float, maxsize: int, store=None):
+        self.name = name
+        self.ttl = ttl
+        self.store = store
+        self.local = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.name}:{key}"
+
+    async def get(self, key: Hashable) -> Optional[Any]:
+        if self.ttl <= 0:
+            return None
+        value = None
+        if self.store is not None:
+            try:
+                raw = await self.store.get(self._key(key))
+                value = None if raw is None else json.loads(raw)
+            except Exception:
+                logger.exception("Cache store read failed")
+        else:
+            value = self.local.get(str(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: Hashable, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        if self.store is not None:
+            try:
+                await self.store.set(self._key(key), json.dumps(value), px=int(self.ttl * 1000))
+            except Exception:
+                logger.exception("Cache store write failed")
+        else:
+            self.local.set(str(key), value)
+
+    async def invalidate(self, keys: Iterable[Hashable]) -> None:
+        keys = [str(key) for key in keys]
+        if len(keys) == 0:
+            return
+        if self.store is not None:
+            try:
+                await self.store.delete(*[self._key(key) for key in keys])
+            except Exception:
+                logger.exception("Cache store invalidation failed")
+        else:
+            self.invalidate_local(keys)
+
+    def invalidate_local(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            self.local.invalidate(str(key))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses,
+                "size": None if self.store is not None else len(self.local)}
+
+
+posting_cache = TTLCache(ttl=POSTING_CACHE_TTL)
+
+if REDIS_URL and redis is None:
+    logger.warning("REDIS_URL is set but the redis package is not installed, using in-process cache")
+_store = redis.from_url(REDIS_URL) if REDIS_URL and redis is not None else None
+
+sku_info_cache = ReadThroughCache("sku_info", READ_CACHE_TTL, READ_CACHE_SIZE, _store)
+item_info_cache = ReadThroughCache("item_info", READ_CACHE_TTL, READ_CACHE_SIZE, _store)
+items_by_sku_cache = ReadThroughCache("items_by_sku", READ_CACHE_TTL, READ_CACHE_SIZE, _store)
+
+
+async def broadcast_invalidation(session: AsyncSession, item_ids: Iterable[Hashable],
+                                 sku_ids: Iterable[Hashable]) -> None:
+    # In-process caches live in every worker: tell them over NOTIFY. Called
+    # before the write commits, the message goes out with the change or not
+    # at all. A worker whose listener is reconnecting misses it and serves
+    # the entry until READ_CACHE_TTL expires it.
+    item_ids = [str(item_id) for item_id in item_ids]
+    sku_ids = [str(sku_id) for sku_id in set(sku_ids)]
+    if _store is not None or READ_CACHE_TTL <= 0 or len(item_ids) + len(sku_ids) == 0:
+        return
+    messages = [{"items": item_ids[start:start + KEYS_PER_NOTIFY]}
+                for start in range(0, len(item_ids), KEYS_PER_NOTIFY)]
+    messages += [{"skus": sku_ids[start:start + KEYS_PER_NOTIFY]}
+                 for start in range(0, len(sku_ids), KEYS_PER_NOTIFY)]
+    await publish(session, messages, CACHE_CHANNEL)
+
+
+def _apply_invalidation(payload: str) -> None:
+    message = json.loads(payload)
+    item_info_cache.invalidate_local(message.get("items", []))
+    sku_info_cache.invalidate_local(message.get("skus", []))
+    items_by_sku_cache.invalidate_local(message.get("skus", []))
+
+
+if _store is None:
+    broker.add_handler(CACHE_CHANNEL, _apply_invalidation)
+
+
+async def invalidate_skus(sku_ids: Iterable[Hashable]) -> None:
+    # For changes to sku rows or to the price, stock or count of their items.
+    await invalidate_items([], sku_ids)
+
+
+async def invalidate_items(item_ids: Iterable[Hashable], sku_ids: Iterable[Hashable]) -> None:
+    # After the commit, for this worker (or the shared store); the other
+    # workers act on broadcast_invalidation.
+    item_ids = [str(item_id) for item_id in item_ids]
+    sku_ids = [str(sku_id) for sku_id in set(sku_ids)]
+    await item_info_cache.invalidate(item_ids)
+    await sku_info_cache.invalidate(sku_ids)
+    await items_by_sku_cache.invalidate(sku_ids)
+
+
+def cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in (sku_info_cache, item_info_cache, items_by_sku_cache)}
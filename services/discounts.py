@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import List
+from uuid import UUID
+from sqlalchemy import insert, select, cast, literal, any_, or_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from models import sku, discount, discount_sku
+
+
+def _uuid_array(values: List[UUID]):
+    return cast(values, ARRAY(SQLAlchemyUUID(as_uuid=True)))
+
+
+async def link_discount_skus(session: AsyncSession, discount_id: UUID, sku_ids: List[UUID]) -> None:
+    query_links = select(literal(discount_id, SQLAlchemyUUID(as_uuid=True)),
+                         func.unnest(_uuid_array(list(set(sku_ids)))))
+    await session.execute(insert(discount_sku).from_select(["discount_id", "sku_id"], query_links))
+
+
+def finish_discounts_statement(discount_ids: List[UUID]):
+    return sku.update().values(active_discount=None) \
+        .where(sku.c.active_discount == any_(_uuid_array(discount_ids))) \
+        .returning(sku.c.id)
+
+
+async def finish_discounts(session: AsyncSession, discount_ids: List[UUID]) -> List[UUID]:
+    # Detaches the discounts from their SKUs and returns the SKUs to reprice.
+    if len(discount_ids) == 0:
+        return []
+    result = await session.execute(finish_discounts_statement(discount_ids))
+    return list(result.scalars().all())
+
+
+def expire_discounts_statement(now: datetime):
+    # Finishes active discounts past their end and scheduled ones whose whole
+    # window was missed.
+    return discount.update().values(status="finished") \
+        .where(discount.c.status.in_(["active", "scheduled"]), discount.c.ends_at <= now) \
+        .returning(discount.c.id)
+
+
+async def expire_discounts(session: AsyncSession, now: datetime) -> List[UUID]:
+    result = await session.execute(expire_discounts_statement(now))
+    return await finish_discounts(session, list(result.scalars().all()))
+
+
+def activate_discounts_statement(now: datetime):
+    return discount.update().values(status="active") \
+        .where(discount.c.status == "scheduled",
+               discount.c.starts_at <= now,
+               or_(discount.c.ends_at.is_(None), discount.c.ends_at > now)) \
+        .returning(discount.c.id)
+
+
+def apply_discounts_statement(discount_ids: List[UUID]):
+    # SKUs that already carry another active discount keep it.
+    return sku.update().values(active_discount=discount_sku.c.discount_id) \
+        .where(sku.c.id == discount_sku.c.sku_id,
+               discount_sku.c.discount_id == any_(_uuid_array(discount_ids)),
+               sku.c.active_discount.is_(None)) \
+        .returning(sku.c.id)
+
+
+async def activate_discounts(session: AsyncSession, now: datetime) -> List[UUID]:
+    result = await session.execute(activate_discounts_statement(now))
+    discount_ids = list(result.scalars().all())
+    if len(discount_ids) == 0:
+        return []
+
+    result = await session.execute(apply_discounts_statement(discount_ids))
+    return list(result.scalars().all())
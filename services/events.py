@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+import asyncpg
+from sqlalchemy import select, cast, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+
+CHANNEL = "warehouse_events"
+TASKS_PER_EVENT = 100
+RECONNECT_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def make_event(scope: str, scope_id: UUID, **payload) -> dict:
+    return {"scope": scope, "id": scope_id, **payload}
+
+
+def task_events(tasks: Iterable[dict]) -> List[dict]:
+    # Groups task changes by the posting or acceptance they belong to and
+    # splits them so that every NOTIFY payload stays well below 8000 bytes.
+    grouped = {}
+    for item in tasks:
+        if item.get("posting_id") is not None:
+            key = ("posting", item["posting_id"])
+        elif item.get("process_id") is not None:
+            key = ("acceptance", item["process_id"])
+        else:
+            continue
+        grouped.setdefault(key, []).append({"id": item["id"], "status": item["status"]})
+    events = []
+    for (scope, scope_id), items in grouped.items():
+        for start in range(0, len(items), TASKS_PER_EVENT):
+            events.append(make_event(scope, scope_id, tasks=items[start:start + TASKS_PER_EVENT]))
+    return events
+
+
+async def publish(session: AsyncSession, events: List[dict], channel: str = CHANNEL) -> None:
+    # NOTIFY is transactional: subscribers only see the events once the
+    # caller commits, and never for a rolled back transaction.
+    if len(events) == 0:
+        return
+    payloads = func.unnest(cast([json.dumps(event, default=str) for event in events], ARRAY(String))) \
+        .table_valued("payload").render_derived("payloads")
+    await session.execute(select(func.pg_notify(channel, payloads.c.payload)).select_from(payloads))
+
+
+class Subscription:
+
+    def __init__(self, posting_ids: Set[str], acceptance_ids: Set[str], maxsize: int = 1000):
+        self.posting_ids = posting_ids
+        self.acceptance_ids = acceptance_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def matches(self, event: dict) -> bool:
+        if len(self.posting_ids) == 0 and len(self.acceptance_ids) == 0:
+            return True
+        if event.get("scope") == "posting":
+            return event.get("id") in self.posting_ids
+        if event.get("scope") == "acceptance":
+            return event.get("id") in self.acceptance_ids
+        return False
+
+
+class EventBroker:
+    # One LISTEN connection per worker process, fanned out to the SSE clients
+    # connected to that worker and to the other registered channel handlers.
+
+    def __init__(self):
+        self.subscriptions: Set[Subscription] = set()
+        self.handlers: Dict[str, Callable[[str], None]] = {CHANNEL: self.dispatch}
+        self._task: Optional[asyncio.Task] = None
+
+    def add_handler(self, channel: str, handler: Callable[[str], None]) -> None:
+        # Must be registered before start(); the listener subscribes once per
+        # connection.
+        self.handlers[channel] = handler
+
+    def subscribe(self, posting_ids: Iterable[UUID], acceptance_ids: Iterable[UUID]) -> Subscription:
+        subscription = Subscription({str(i) for i in posting_ids}, {str(i) for i in acceptance_ids})
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, payload: str) -> None:
+        event = json.loads(payload)
+        for subscription in list(self.subscriptions):
+            if subscription.matches(event):
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    logger.warning("Dropping event for a slow subscriber")
+
+    async def _listen(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(
+                    host=DB_HOST, port=int(DB_PORT), user=DB_USER, password=DB_PASS, database=DB_NAME)
+                for channel, handler in self.handlers.items():
+                    await connection.add_listener(
+                        channel, lambda conn, pid, channel, payload, handler=handler: handler(payload))
+                while not connection.is_closed():
+                    await asyncio.sleep(RECONNECT_DELAY)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event listener connection failed, reconnecting")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+broker = EventBroker()
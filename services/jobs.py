@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import insert, select, cast, any_, and_, or_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import JOB_WORKERS, JOB_POLL_INTERVAL, JOB_CHUNK_SIZE, JOB_LEASE_TIMEOUT
+from database import async_session_maker
+from models import job, sku
+from schemas import ItemToAccept
+from services.acceptance import insert_placing_tasks
+from services.cache import invalidate_skus, broadcast_invalidation
+from services.events import make_event, publish
+from services.pricing import reprice_items
+
+ACCEPTANCE_UNITS_PER_CHUNK = 50000
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS: Dict[str, Callable[["JobContext"], Awaitable[dict]]] = {}
+
+
+def job_handler(job_type: str):
+    def decorator(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return decorator
+
+
+async def enqueue_job(session: AsyncSession, job_type: str, payload: dict, total: Optional[int] = None) -> UUID:
+    # Runs in the caller's transaction, so the job only exists if the request
+    # that scheduled it commits.
+    job_id = uuid.uuid4()
+    now = datetime.utcnow()
+    stmt = insert(job).values(id=job_id, type=job_type, status="queued", payload=payload, progress=0,
+                              total=total, created_at=now, updated_at=now)
+    await session.execute(stmt)
+    return job_id
+
+
+class JobLeaseLost(Exception):
+    pass
+
+
+class JobContext:
+
+    def __init__(self, job_id: UUID, lease_id: UUID, payload: dict, progress: int, result: Optional[dict]):
+        self.job_id = job_id
+        self.lease_id = lease_id
+        self.payload = payload
+        self.progress = progress
+        self.result = result or {}
+
+    async def set_progress(self, session: AsyncSession, progress: int, total: Optional[int] = None,
+                           result: Optional[dict] = None) -> None:
+        # Written in the handler's chunk transaction so progress never runs
+        # ahead of committed work; a resumed job skips everything up to it.
+        # Raising rolls the chunk back if another worker took the job over.
+        values = {"progress": progress, "updated_at": datetime.utcnow()}
+        if total is not None:
+            values["total"] = total
+        if result is not None:
+            values["result"] = result
+        update_progress = job.update().values(**values) \
+            .where(job.c.id == self.job_id, job.c.locked_by == self.lease_id)
+        if (await session.execute(update_progress)).rowcount == 0:
+            raise JobLeaseLost(self.job_id)
+        self.progress = progress
+
+
+def _lease_until() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=JOB_LEASE_TIMEOUT)
+
+
+def claim_job_statement(lease_id: UUID, now: datetime):
+    # Takes the oldest queued job, or a running one whose worker stopped
+    # renewing its lease.
+    next_job = select(job.c.id) \
+        .where(or_(job.c.status == "queued", and_(job.c.status == "running", job.c.locked_until < now))) \
+        .order_by(job.c.created_at) \
+        .limit(1) \
+        .with_for_update(skip_locked=True) \
+        .cte("next_job")
+    return job.update().values(status="running", locked_by=lease_id, locked_until=_lease_until(), updated_at=now) \
+        .where(job.c.id.in_(select(next_job.c.id))) \
+        .returning(job.c.id, job.c.type, job.c.payload, job.c.progress, job.c.result)
+
+
+async def claim_job(session: AsyncSession, lease_id: UUID):
+    result = await session.execute(claim_job_statement(lease_id, datetime.utcnow()))
+    return result.mappings().first()
+
+
+async def _update_leased_job(job_id: UUID, lease_id: UUID, **values) -> None:
+    async with async_session_maker() as session:
+        await session.execute(job.update().values(updated_at=datetime.utcnow(), **values)
+                              .where(job.c.id == job_id, job.c.locked_by == lease_id))
+        await session.commit()
+
+
+async def _renew_lease(job_id: UUID, lease_id: UUID) -> None:
+    while True:
+        await asyncio.sleep(JOB_LEASE_TIMEOUT / 3)
+        try:
+            await _update_leased_job(job_id, lease_id, locked_until=_lease_until())
+        except Exception:
+            logger.exception("Renewing the lease of job %s failed", job_id)
+
+
+async def run_next_job() -> bool:
+    lease_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        claimed = await claim_job(session, lease_id)
+        await session.commit()
+    if claimed is None:
+        return False
+
+    renewal = asyncio.create_task(_renew_lease(claimed.id, lease_id))
+    values = {"status": "completed"}
+    try:
+        handler = JOB_HANDLERS[claimed.type]
+        values["result"] = await handler(JobContext(claimed.id, lease_id, claimed.payload, claimed.progress,
+                                                    claimed.result))
+    except JobLeaseLost:
+        logger.warning("Job %s was taken over by another worker", claimed.id)
+        return True
+    except asyncio.CancelledError:
+        # Shutdown or worker recycling: hand the job back right away instead
+        # of waiting for the lease to expire.
+        await _update_leased_job(claimed.id, lease_id, status="queued", locked_by=None, locked_until=None)
+        raise
+    except Exception as exc:
+        logger.exception("Job %s failed", claimed.id)
+        values = {"status": "failed", "error": str(exc)}
+    finally:
+        renewal.cancel()
+
+    await _update_leased_job(claimed.id, lease_id, locked_by=None, locked_until=None, **values)
+    return True
+
+
+class JobRunner:
+
+    def __init__(self, workers: int, interval: float):
+        self.workers = workers
+        self.interval = interval
+        self._tasks: List[asyncio.Task] = []
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await run_next_job():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job runner iteration failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if len(self._tasks) == 0:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_POLL_INTERVAL)
+
+
+@job_handler("reprice_skus")
+async def reprice_skus_job(context: JobContext) -> dict:
+    sku_ids = [UUID(sku_id) for sku_id in context.payload["sku_ids"]]
+    repriced_items = context.result.get("repriced_items", 0)
+    for start in range(context.progress, len(sku_ids), JOB_CHUNK_SIZE):
+        chunk = sku_ids[start:start + JOB_CHUNK_SIZE]
+        async with async_session_maker() as session:
+            repriced_items += await reprice_items(
+                session, sku.c.id == any_(cast(chunk, ARRAY(SQLAlchemyUUID(as_uuid=True)))))
+            await context.set_progress(session, start + len(chunk), len(sku_ids),
+                                       {"repriced_items": repriced_items})
+            await broadcast_invalidation(session, [], chunk)
+            await session.commit()
+        await invalidate_skus(chunk)
+    return {"repriced_items": repriced_items}
+
+
+@job_handler("create_acceptance")
+async def create_acceptance_job(context: JobContext) -> dict:
+    # Units are inserted in chunks of ACCEPTANCE_UNITS_PER_CHUNK, each in its
+    # own transaction; large lines are split across chunks. The split only
+    # depends on the payload, so a resumed job skips exactly the chunks whose
+    # progress was committed.
+    acceptance_id = UUID(context.payload["acceptance_id"])
+    items = [ItemToAccept(**item) for item in context.payload["items"]]
+    total = sum(item.count for item in items)
+
+    chunks = [[]]
+    chunk_units = 0
+    for item in items:
+        remaining = item.count
+        while remaining > 0:
+            units = min(remaining, ACCEPTANCE_UNITS_PER_CHUNK - chunk_units)
+            chunks[-1].append(ItemToAccept(sku_id=item.sku_id, stock=item.stock, count=units))
+            chunk_units += units
+            remaining -= units
+            if chunk_units == ACCEPTANCE_UNITS_PER_CHUNK:
+                chunks.append([])
+                chunk_units = 0
+    if len(chunks) > 1 and len(chunks[-1]) == 0:
+        chunks.pop()
+
+    done = 0
+    for chunk in chunks:
+        units_in_chunk = sum(item.count for item in chunk)
+        if units_in_chunk > 0 and done + units_in_chunk <= context.progress:
+            done += units_in_chunk
+            continue
+        async with async_session_maker() as session:
+            await insert_placing_tasks(session, acceptance_id, chunk)
+            done += units_in_chunk
+            await context.set_progress(session, done, total)
+            if done == total:
+                await publish(session, [make_event("acceptance", acceptance_id, status="created")])
+            await session.commit()
+    return {"id": str(acceptance_id), "accepted_units": total}
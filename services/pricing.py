@@ -0,0 +1,88 @@
+from typing import List, Tuple
+from uuid import UUID
+from sqlalchemy import Table, Column, MetaData, Integer, Float, select, cast, Numeric
+from sqlalchemy.dialects.postgresql import UUID as SQLAlchemyUUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from models import stock_table, sku, discount
+
+
+def actual_price_expression():
+    # base_price * min(1 - discount, 1 - markdown), rounded to cents. The
+    # active discount is looked up per SKU, so items without one pay the
+    # markdown-only price.
+    percentage = select(discount.c.percentage) \
+        .where(discount.c.id == sku.c.active_discount) \
+        .scalar_subquery()
+    multiplier = func.least(1 - func.coalesce(percentage, 0), 1 - func.coalesce(stock_table.c.markdown, 0))
+    return func.round(cast(sku.c.base_price * multiplier, Numeric), 2)
+
+
+def reprice_items_statement(*conditions):
+    # Recomputes actual_price of every item matching the conditions (on
+    # stock_table or sku) with a single UPDATE ... FROM sku.
+    return stock_table.update().values(actual_price=actual_price_expression()) \
+        .where(stock_table.c.sku_id == sku.c.id, *conditions)
+
+
+async def reprice_items(session: AsyncSession, *conditions) -> int:
+    result = await session.execute(reprice_items_statement(*conditions))
+    return result.rowcount
+
+
+# Session-local staging table for bulk price imports; kept out of the models
+# metadata so migrations never see it.
+price_import: Table = Table(
+    "price_import",
+    MetaData(),
+    Column('line', Integer, nullable=False),
+    Column('sku_id', SQLAlchemyUUID(as_uuid=True), nullable=False),
+    Column('base_price', Float, nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+async def create_price_import(session: AsyncSession) -> None:
+    connection = await session.connection()
+    await connection.run_sync(price_import.create)
+
+
+async def copy_price_rows(session: AsyncSession, rows: List[Tuple[int, UUID, float]]) -> None:
+    if len(rows) == 0:
+        return
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        price_import.name, records=rows, columns=["line", "sku_id", "base_price"])
+
+
+async def apply_price_import(session: AsyncSession, max_reported: int, reprice: bool = True) -> dict:
+    # The last line wins when a SKU appears several times in the price list.
+    # The updated SKU ids are returned under "sku_ids"; with reprice=False
+    # their items are left for the caller to reprice.
+    unknown = select(price_import.c.sku_id) \
+        .outerjoin(sku, sku.c.id == price_import.c.sku_id) \
+        .where(sku.c.id.is_(None)) \
+        .distinct() \
+        .subquery()
+    result = await session.execute(select(func.count()).select_from(unknown))
+    unknown_count = result.scalar()
+    result = await session.execute(select(unknown.c.sku_id).limit(max_reported))
+    unknown_ids = result.scalars().all()
+
+    latest = select(price_import.c.sku_id, price_import.c.base_price) \
+        .distinct(price_import.c.sku_id) \
+        .order_by(price_import.c.sku_id, price_import.c.line.desc()) \
+        .subquery()
+    update_base_price = sku.update().values(base_price=latest.c.base_price) \
+        .where(sku.c.id == latest.c.sku_id) \
+        .returning(sku.c.id)
+    result = await session.execute(update_base_price)
+    updated_ids = result.scalars().all()
+
+    response_data = {"updated_skus": len(updated_ids), "sku_ids": updated_ids,
+                     "unknown_sku_count": unknown_count, "unknown_sku_ids": unknown_ids}
+    if reprice:
+        response_data["repriced_items"] = await reprice_items(session, sku.c.id.in_(select(price_import.c.sku_id)))
+    return response_data
@@ -0,0 +1,129 @@
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select, label, literal_column, tuple_, JSON
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.sql.functions import func
+from models import acceptance, acceptance_sku, task, sku, stock_table, posting, sku_stock_counter
+
+# Read statements of the endpoints, built here so services.query_plans can
+# explain exactly what the controllers run.
+
+
+def _json_list(expression):
+    return func.coalesce(expression, literal_column("'[]'::json"), type_=JSON)
+
+
+def sku_info_query(*conditions):
+    return select(sku.c.id, sku.c.created_at, func.sum(sku_stock_counter.c.price_sum).label('actual_price'),
+                  sku.c.base_price, func.sum(sku_stock_counter.c.item_count).label('count'), sku.c.is_hidden)\
+        .join(sku_stock_counter, sku_stock_counter.c.sku_id == sku.c.id).where(*conditions)\
+        .group_by(sku.c.id)\
+        .having(func.sum(sku_stock_counter.c.item_count) > 0)
+
+
+def items_by_sku_query(sku_id: UUID, stock: Optional[str] = None, reserved_state: Optional[bool] = None,
+                       cursor: Optional[UUID] = None):
+    conditions = [stock_table.c.sku_id == sku_id]
+    if stock is not None:
+        conditions.append(stock_table.c.stock == stock)
+    if reserved_state is not None:
+        conditions.append(stock_table.c.reserved_state.is_(reserved_state))
+    if cursor is not None:
+        conditions.append(stock_table.c.id > cursor)
+    return select(label('item_id', stock_table.c.id), stock_table.c.stock, stock_table.c.reserved_state) \
+        .where(*conditions) \
+        .order_by(stock_table.c.id)
+
+
+def posting_query(posting_id: UUID):
+    query_cost = select(func.sum(stock_table.c.actual_price)) \
+        .join(task, task.c.item_id == stock_table.c.id) \
+        .where(task.c.posting_id == posting_id,
+               stock_table.c.stock != "NotFound",
+               stock_table.c.reserved_state.is_(True)) \
+        .scalar_subquery()
+
+    query_stock = select(task.c.sku_id,
+                         _json_list(func.json_agg(task.c.item_id).filter(task.c.stock == "valid"))
+                         .label('from_valid_ids'),
+                         _json_list(func.json_agg(task.c.item_id).filter(task.c.stock == "defect"))
+                         .label('from_defect_ids')) \
+        .where(task.c.posting_id == posting_id) \
+        .group_by(task.c.sku_id) \
+        .subquery()
+    ordered_goods_json = select(_json_list(func.json_agg(func.json_build_object(
+        'sku', query_stock.c.sku_id,
+        'from_valid_ids', query_stock.c.from_valid_ids,
+        'from_defect_ids', query_stock.c.from_defect_ids)))).scalar_subquery()
+
+    notfound_json = select(_json_list(func.json_agg(func.json_build_object('id', stock_table.c.id)))) \
+        .join(task, task.c.item_id == stock_table.c.id) \
+        .where(task.c.posting_id == posting_id, stock_table.c.stock == "NotFound") \
+        .scalar_subquery()
+
+    tasks_json = select(_json_list(func.json_agg(func.json_build_object(
+        'id', task.c.id, 'type', task.c.type, 'status', task.c.status)))) \
+        .where(task.c.posting_id == posting_id) \
+        .scalar_subquery()
+
+    return select(posting.c.id, posting.c.status, posting.c.created_at,
+                  query_cost.label('cost'),
+                  ordered_goods_json.label('ordered_goods'),
+                  notfound_json.label('not_found'),
+                  tasks_json.label('task_ids')) \
+        .where(posting.c.id == posting_id)
+
+
+def acceptance_info_query(acceptance_id: UUID, cursor: Optional[UUID], limit: int):
+    # Per-(sku, stock) totals stored at creation and one page of task ids,
+    # plus one row to tell whether there is a next page.
+    accepted_json = select(_json_list(
+        func.json_agg(func.json_build_object('sku_id', acceptance_sku.c.sku_id, 'stock', acceptance_sku.c.stock,
+                                             'count', acceptance_sku.c.count)))) \
+        .where(acceptance_sku.c.acceptance_id == acceptance_id).scalar_subquery()
+
+    page_conditions = [task.c.process_id == acceptance_id]
+    if cursor is not None:
+        page_conditions.append(task.c.id > cursor)
+    query_page = select(task.c.id, task.c.status).where(*page_conditions)\
+        .order_by(task.c.id).limit(limit + 1).subquery()
+    tasks_json = select(_json_list(
+        func.json_agg(aggregate_order_by(func.json_build_object('id', query_page.c.id, 'status', query_page.c.status),
+                                         query_page.c.id)))).scalar_subquery()
+
+    return select(acceptance.c.id, acceptance.c.created_at,
+                  accepted_json.label('accepted'), tasks_json.label('task_ids'))\
+        .where(acceptance.c.id == acceptance_id)
+
+
+def tasks_query(limit: int, status: Optional[str] = None, type: Optional[str] = None,
+                sku_id: Optional[UUID] = None, process_id: Optional[UUID] = None,
+                posting_id: Optional[UUID] = None,
+                created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                after: Optional[Tuple[datetime, UUID]] = None):
+    # One page in (created_at, id) order, plus one row to tell whether there
+    # is a next page.
+    conditions = []
+    if status is not None:
+        conditions.append(task.c.status == status)
+    if type is not None:
+        conditions.append(task.c.type == type)
+    if sku_id is not None:
+        conditions.append(task.c.sku_id == sku_id)
+    if process_id is not None:
+        conditions.append(task.c.process_id == process_id)
+    if posting_id is not None:
+        conditions.append(task.c.posting_id == posting_id)
+    if created_from is not None:
+        conditions.append(task.c.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(task.c.created_at < created_to)
+    if after is not None:
+        conditions.append(tuple_(task.c.created_at, task.c.id) > tuple_(*after))
+
+    return select(task.c.id, task.c.status, task.c.created_at, task.c.type, task.c.process_id,
+                  task.c.sku_id, task.c.stock, task.c.item_id, task.c.posting_id) \
+        .where(*conditions) \
+        .order_by(task.c.created_at, task.c.id) \
+        .limit(limit + 1)
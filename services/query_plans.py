@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import json
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from database import async_session_maker
+from models import sku
+from services.discounts import finish_discounts_statement, expire_discounts_statement, \
+    activate_discounts_statement, apply_discounts_statement
+from services.jobs import claim_job_statement
+from services.pricing import reprice_items_statement
+from services.queries import items_by_sku_query, sku_info_query, posting_query, acceptance_info_query, tasks_query
+from services.reservation import allocate_items_statement
+from services.tasks import finish_claim_statement, posting_statuses_statement, claim_tasks_statement
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    explained = compiler.process(element.statement, **kw)
+    # The plan is a single JSON column, whatever the explained statement
+    # would have returned.
+    compiler.isinsert = compiler.isupdate = compiler.isdelete = False
+    compiler._result_columns = []
+    return "EXPLAIN (FORMAT JSON) " + explained
+
+
+# Endpoint pages must find their rows through the index condition alone;
+# a scan that filters on the way would walk rows of other keys.
+PAGED_QUERIES = {"getItemInfoBySkuId", "getAcceptanceInfo", "getTasks"}
+
+
+def hot_queries() -> List[Tuple[str, object]]:
+    # The statements the endpoints and workers execute, built by the same
+    # functions with placeholder arguments.
+    some_id = uuid.uuid4()
+    some_ids = [uuid.uuid4(), uuid.uuid4()]
+    now = datetime.utcnow()
+    return [
+        ("getItemInfoBySkuId", items_by_sku_query(some_id, cursor=some_id).limit(1001)),
+        ("getSkuInfo", sku_info_query(sku.c.id == some_id)),
+        ("getPosting", posting_query(some_id)),
+        ("getAcceptanceInfo", acceptance_info_query(some_id, some_id, 1000)),
+        ("getTasks", tasks_query(100, status="in_work")),
+        ("allocate_items", allocate_items_statement({(some_id, "valid"): 10})),
+        ("reprice_items", reprice_items_statement(sku.c.active_discount == some_id)),
+        ("finish_discounts", finish_discounts_statement(some_ids)),
+        ("expire_discounts", expire_discounts_statement(now)),
+        ("activate_discounts", activate_discounts_statement(now)),
+        ("apply_discounts", apply_discounts_statement(some_ids)),
+        ("finish_tasks", finish_claim_statement({some_id: "completed"})),
+        ("update_posting_statuses", posting_statuses_statement(some_ids)),
+        ("claim_tasks", claim_tasks_statement("worker", "picking", 10, now)),
+        ("claim_job", claim_job_statement(some_id, now)),
+    ]
+
+
+def _plan_problems(plan: dict, paged: bool) -> Iterator[str]:
+    # A sequential scan, or a LIMIT that is produced by sorting every matching
+    # row instead of reading an index in order.
+    if plan.get("Node Type") == "Seq Scan":
+        yield f"Seq Scan on {plan.get('Relation Name')}"
+    if plan.get("Node Type") == "Limit":
+        child = plan["Plans"][0]
+        while child.get("Node Type") == "LockRows":
+            child = child["Plans"][0]
+        if child.get("Node Type") in ("Sort", "Incremental Sort"):
+            yield f"{child['Node Type']} under Limit"
+        if paged and child.get("Node Type") in ("Index Scan", "Index Only Scan") and "Filter" in child:
+            yield f"Filter on {child.get('Index Name')} under Limit"
+    for child in plan.get("Plans", []):
+        yield from _plan_problems(child, paged)
+
+
+async def check_query_plans(session: AsyncSession) -> List[dict]:
+    # With sequential scans and sorts priced out, the planner only picks one
+    # when no index can serve the query or return it in order, so the check
+    # does not depend on how much data the database holds.
+    await session.execute(text("SET LOCAL enable_seqscan = off"))
+    await session.execute(text("SET LOCAL enable_sort = off"))
+    failures = []
+    for name, statement in hot_queries():
+        result = await session.execute(Explain(statement))
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        problems = list(_plan_problems(plan[0]["Plan"], name in PAGED_QUERIES))
+        if len(problems) != 0:
+            failures.append({"query": name, "problems": problems})
+    return failures
+
+
+async def main() -> None:
+    async with async_session_maker() as session:
+        failures = await check_query_plans(session)
+        await session.rollback()
+    print(json.dumps(failures, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Fail if a hot query is planned with a sequential scan or a sorted page").parse_args()
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import insert, select, cast, literal, null, true, and_, any_, Integer, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from models import task, stock_table
+from schemas import ItemRequest, ItemQuantityRequest
+
+
+class RequestedItems:
+    # Flattened view of PostingRequest.ordered_goods: one entry per item id,
+    # kept as parallel arrays so every statement sends them as three binds.
+
+    def __init__(self, ordered_goods: Optional[List[ItemRequest]] = None):
+        self.item_ids: List[UUID] = []
+        self.sku_ids: List[UUID] = []
+        self.stocks: List[str] = []
+        for item in ordered_goods or []:
+            for item_id in item.from_valid_ids:
+                self.add(item_id, item.sku, "valid")
+            for item_id in item.from_defect_ids:
+                self.add(item_id, item.sku, "defect")
+
+    def add(self, item_id: UUID, sku_id: UUID, stock: str) -> None:
+        self.item_ids.append(item_id)
+        self.sku_ids.append(sku_id)
+        self.stocks.append(stock)
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def table(self):
+        return func.unnest(
+            cast(self.item_ids, ARRAY(SQLAlchemyUUID(as_uuid=True))),
+            cast(self.sku_ids, ARRAY(SQLAlchemyUUID(as_uuid=True))),
+            cast(self.stocks, ARRAY(String)),
+        ).table_valued("item_id", "sku_id", "stock").render_derived("requested")
+
+
+async def count_requested_items(session: AsyncSession, requested: RequestedItems) -> Tuple[int, int]:
+    # Distinct requested items that exist in the requested sku and stock, and
+    # how many of those are still free.
+    items = requested.table()
+    distinct_ids = func.count(func.distinct(stock_table.c.id))
+    query_check = select(distinct_ids, distinct_ids.filter(stock_table.c.reserved_state.is_(False))) \
+        .select_from(items.join(stock_table, and_(stock_table.c.id == items.c.item_id,
+                                                  stock_table.c.sku_id == items.c.sku_id,
+                                                  stock_table.c.stock == items.c.stock)))
+    result = await session.execute(query_check)
+    found, free = result.one()
+    return found, free
+
+
+async def reserve_items(session: AsyncSession, requested: RequestedItems) -> List[UUID]:
+    # Rows are locked in id order with SKIP LOCKED, so concurrent postings never
+    # wait on or deadlock against each other: an item locked or already flipped
+    # by another posting is simply left out, and the caller detects the lost
+    # race by comparing row counts.
+    item_ids = cast(requested.item_ids, ARRAY(SQLAlchemyUUID(as_uuid=True)))
+    locked = select(stock_table.c.id) \
+        .where(stock_table.c.id == any_(item_ids), stock_table.c.reserved_state.is_(False)) \
+        .order_by(stock_table.c.id) \
+        .with_for_update(skip_locked=True) \
+        .cte("locked")
+    update_reserved = stock_table.update().values(reserved_state=True) \
+        .where(stock_table.c.id.in_(select(locked.c.id)), stock_table.c.reserved_state.is_(False)) \
+        .returning(stock_table.c.id)
+    result = await session.execute(update_reserved)
+    return list(result.scalars().all())
+
+
+def group_quantities(ordered_goods: List[ItemQuantityRequest]) -> Dict[Tuple[UUID, str], int]:
+    quantities: Dict[Tuple[UUID, str], int] = {}
+    for item in ordered_goods:
+        quantities[(item.sku, item.stock)] = quantities.get((item.sku, item.stock), 0) + item.quantity
+    return quantities
+
+
+def allocate_items_statement(quantities: Dict[Tuple[UUID, str], int]):
+    # Picks the oldest free rows of every (sku, stock) pair in one statement;
+    # rows locked by concurrent postings are skipped rather than waited on.
+    wanted = func.unnest(
+        cast([key[0] for key in quantities], ARRAY(SQLAlchemyUUID(as_uuid=True))),
+        cast([key[1] for key in quantities], ARRAY(String)),
+        cast(list(quantities.values()), ARRAY(Integer)),
+    ).table_valued("sku_id", "stock", "quantity").render_derived("wanted")
+    free = select(stock_table.c.id) \
+        .where(stock_table.c.sku_id == wanted.c.sku_id,
+               stock_table.c.stock == wanted.c.stock,
+               stock_table.c.reserved_state.is_(False)) \
+        .order_by(stock_table.c.created_at, stock_table.c.id) \
+        .limit(wanted.c.quantity) \
+        .with_for_update(skip_locked=True) \
+        .lateral("free")
+    candidates = select(free.c.id).select_from(wanted.join(free, true())).cte("candidates")
+    return stock_table.update().values(reserved_state=True) \
+        .where(stock_table.c.id.in_(select(candidates.c.id)), stock_table.c.reserved_state.is_(False)) \
+        .returning(stock_table.c.id, stock_table.c.sku_id, stock_table.c.stock)
+
+
+async def allocate_items(session: AsyncSession, quantities: Dict[Tuple[UUID, str], int]) -> RequestedItems:
+    result = await session.execute(allocate_items_statement(quantities))
+
+    allocated = RequestedItems()
+    for item in result.mappings().all():
+        allocated.add(item.id, item.sku_id, item.stock)
+    return allocated
+
+
+async def insert_picking_tasks(session: AsyncSession, posting_id: UUID, requested: RequestedItems) -> None:
+    items = requested.table()
+    query_items = select(
+        func.gen_random_uuid(),
+        literal("in_work"), literal(datetime.utcnow(), DateTime),
+        literal("picking"), null(),
+        items.c.sku_id,
+        items.c.stock,
+        items.c.item_id,
+        literal(posting_id, SQLAlchemyUUID(as_uuid=True))).select_from(items)
+
+    stmt_insert = insert(task).from_select(
+        ["id", "status", "created_at", "type", "process_id", "sku_id", "stock", "item_id", "posting_id"],
+        query_items)
+    await session.execute(stmt_insert)
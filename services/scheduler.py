@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select, cast, any_
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID
+from sqlalchemy.sql.functions import func
+from config import DISCOUNT_SCHEDULER_INTERVAL, STOCK_COUNTER_COMPACT_INTERVAL
+from database import async_session_maker
+from models import sku
+from services.cache import invalidate_skus, broadcast_invalidation
+from services.discounts import activate_discounts, expire_discounts
+from services.pricing import reprice_items
+from services.stock_counters import compact_stock_counters
+
+DISCOUNT_SCHEDULER_LOCK = 7301
+STOCK_COUNTER_COMPACT_LOCK = 7302
+
+logger = logging.getLogger(__name__)
+
+
+async def run_discount_schedule() -> bool:
+    # Every worker runs this loop, but only the one holding the transaction
+    # level advisory lock applies a pass; the others skip it.
+    async with async_session_maker() as session:
+        result = await session.execute(select(func.pg_try_advisory_xact_lock(DISCOUNT_SCHEDULER_LOCK)))
+        if not result.scalar():
+            return False
+        now = datetime.utcnow()
+        sku_ids = set(await expire_discounts(session, now))
+        sku_ids.update(await activate_discounts(session, now))
+        if len(sku_ids) != 0:
+            await reprice_items(session, sku.c.id == any_(cast(list(sku_ids), ARRAY(SQLAlchemyUUID(as_uuid=True)))))
+        await broadcast_invalidation(session, [], sku_ids)
+        await session.commit()
+    await invalidate_skus(sku_ids)
+    return True
+
+
+async def run_stock_counter_compaction() -> bool:
+    async with async_session_maker() as session:
+        result = await session.execute(select(func.pg_try_advisory_xact_lock(STOCK_COUNTER_COMPACT_LOCK)))
+        if not result.scalar():
+            return False
+        await compact_stock_counters(session)
+        await session.commit()
+    return True
+
+
+class PeriodicTask:
+
+    def __init__(self, name: str, interval: float, run: Callable[[], Awaitable[bool]]):
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("%s pass failed", self.name)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+discount_scheduler = PeriodicTask("Discount scheduler", DISCOUNT_SCHEDULER_INTERVAL, run_discount_schedule)
+stock_counter_compactor = PeriodicTask("Stock counter compaction", STOCK_COUNTER_COMPACT_INTERVAL,
+                                       run_stock_counter_compaction)
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import json
+from typing import Dict, Iterable, List, Tuple
+from uuid import UUID
+from sqlalchemy import select, delete, insert, and_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from database import async_session_maker
+from models import stock_table, sku_stock_counter
+
+PRICE_TOLERANCE = 0.01
+
+
+async def free_item_counts(session: AsyncSession, sku_ids: Iterable[UUID]) -> Dict[Tuple[UUID, str], int]:
+    # Reads the counter rows of the SKUs, independent of how many items they
+    # have.
+    query = select(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock,
+                   func.sum(sku_stock_counter.c.item_count).label('item_count')) \
+        .where(sku_stock_counter.c.sku_id.in_(list(sku_ids)),
+               sku_stock_counter.c.reserved_state.is_(False)) \
+        .group_by(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock)
+    result = await session.execute(query)
+    return {(row.sku_id, row.stock): row.item_count for row in result.mappings().all()}
+
+
+def _actual_totals():
+    return select(stock_table.c.sku_id, stock_table.c.stock, stock_table.c.reserved_state,
+                  func.count().label('item_count'),
+                  func.coalesce(func.sum(stock_table.c.actual_price), 0).label('price_sum')) \
+        .group_by(stock_table.c.sku_id, stock_table.c.stock, stock_table.c.reserved_state)
+
+
+async def verify_stock_counters(session: AsyncSession) -> List[dict]:
+    # Compares the counters with a full aggregation of stock_table and returns
+    # the (sku, stock, reserved_state) combinations that drifted.
+    actual = _actual_totals().subquery()
+    counted = select(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock, sku_stock_counter.c.reserved_state,
+                     func.sum(sku_stock_counter.c.item_count).label('item_count'),
+                     func.sum(sku_stock_counter.c.price_sum).label('price_sum')) \
+        .group_by(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock, sku_stock_counter.c.reserved_state) \
+        .subquery()
+    query = select(func.coalesce(actual.c.sku_id, counted.c.sku_id).label('sku_id'),
+                   func.coalesce(actual.c.stock, counted.c.stock).label('stock'),
+                   func.coalesce(actual.c.reserved_state, counted.c.reserved_state).label('reserved_state'),
+                   func.coalesce(actual.c.item_count, 0).label('actual_count'),
+                   func.coalesce(counted.c.item_count, 0).label('counted_count'),
+                   func.coalesce(actual.c.price_sum, 0).label('actual_price_sum'),
+                   func.coalesce(counted.c.price_sum, 0).label('counted_price_sum')) \
+        .select_from(actual.outerjoin(counted, and_(actual.c.sku_id == counted.c.sku_id,
+                                                    actual.c.stock == counted.c.stock,
+                                                    actual.c.reserved_state == counted.c.reserved_state),
+                                      full=True)) \
+        .where((func.coalesce(actual.c.item_count, 0) != func.coalesce(counted.c.item_count, 0)) |
+               (func.abs(func.coalesce(actual.c.price_sum, 0) - func.coalesce(counted.c.price_sum, 0))
+                > PRICE_TOLERANCE))
+    result = await session.execute(query)
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def compact_stock_counters(session: AsyncSession) -> int:
+    # Folds the delta rows of every (sku, stock, reserved_state) into one.
+    # Rows appended after the statement started are left for the next pass;
+    # combinations that net to no items are dropped.
+    keys = select(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock, sku_stock_counter.c.reserved_state) \
+        .group_by(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock, sku_stock_counter.c.reserved_state) \
+        .having(func.count() > 1) \
+        .cte("keys")
+    moved = delete(sku_stock_counter) \
+        .where(sku_stock_counter.c.sku_id == keys.c.sku_id,
+               sku_stock_counter.c.stock == keys.c.stock,
+               sku_stock_counter.c.reserved_state == keys.c.reserved_state) \
+        .returning(sku_stock_counter.c.sku_id, sku_stock_counter.c.stock, sku_stock_counter.c.reserved_state,
+                   sku_stock_counter.c.item_count, sku_stock_counter.c.price_sum) \
+        .cte("moved")
+    query = select(moved.c.sku_id, moved.c.stock, moved.c.reserved_state,
+                   func.sum(moved.c.item_count), func.sum(moved.c.price_sum)) \
+        .group_by(moved.c.sku_id, moved.c.stock, moved.c.reserved_state) \
+        .having(func.sum(moved.c.item_count) != 0)
+    result = await session.execute(insert(sku_stock_counter).from_select(
+        ["sku_id", "stock", "reserved_state", "item_count", "price_sum"], query))
+    return result.rowcount
+
+
+async def rebuild_stock_counters(session: AsyncSession) -> None:
+    # Blocks writers to stock_table until the caller commits, so no delta can
+    # slip in between the wipe and the recount.
+    await session.execute(text("LOCK TABLE stock_table IN SHARE MODE"))
+    await session.execute(delete(sku_stock_counter))
+    actual = _actual_totals().subquery()
+    query = select(actual.c.sku_id, actual.c.stock, actual.c.reserved_state, actual.c.item_count, actual.c.price_sum)
+    await session.execute(insert(sku_stock_counter).from_select(
+        ["sku_id", "stock", "reserved_state", "item_count", "price_sum"], query))
+
+
+async def main(command: str) -> None:
+    async with async_session_maker() as session:
+        if command == "rebuild":
+            await rebuild_stock_counters(session)
+            await session.commit()
+        drift = await verify_stock_counters(session)
+        print(json.dumps(drift, default=str, indent=2))
+        if drift:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify or rebuild the per-SKU stock counters")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    asyncio.run(main(parser.parse_args().command))
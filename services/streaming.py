@@ -0,0 +1,81 @@
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, List, Tuple, Type
+from pydantic import BaseModel, ValidationError
+from starlette.requests import Request
+
+MAX_REPORTED_ERRORS = 1000
+
+
+class RowErrors:
+    # Every rejected line is counted, but only the first max_reported are
+    # returned with their messages.
+
+    def __init__(self, max_reported: int = MAX_REPORTED_ERRORS):
+        self.max_reported = max_reported
+        self.count = 0
+        self.items: List[dict] = []
+
+    def add(self, line_number: int, messages: List[str]) -> None:
+        self.count += 1
+        if len(self.items) < self.max_reported:
+            self.items.append({"line": line_number, "errors": messages})
+
+    def as_dict(self) -> dict:
+        return {"error_count": self.count, "errors": self.items}
+
+
+def stream_format(request: Request) -> str:
+    return "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in stream:
+        tail += decoder.decode(chunk)
+        lines = tail.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def iter_rows(stream: AsyncIterator[bytes], fmt: str, model: Type[BaseModel]) -> AsyncIterator[Tuple[int, Any]]:
+    # Yields (line number, model instance or list of error messages) for a CSV
+    # (with header) or NDJSON body without holding more than one line in memory.
+    header = None
+    line_number = 0
+    async for line in iter_lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                row = {name: value.strip() for name, value in zip(header, values) if value.strip() != ""}
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Row must be a JSON object")
+            yield line_number, model(**row)
+        except ValidationError as exc:
+            yield line_number, [error["msg"] for error in exc.errors()]
+        except (ValueError, csv.Error) as exc:
+            yield line_number, [str(exc)]
+
+
+async def iter_valid_rows(stream: AsyncIterator[bytes], fmt: str, model: Type[BaseModel],
+                          errors: RowErrors) -> AsyncIterator[Tuple[int, Any]]:
+    # iter_rows without the rejected lines, which are collected in errors.
+    async for line_number, row in iter_rows(stream, fmt, model):
+        if isinstance(row, list):
+            errors.add(line_number, row)
+            continue
+        yield line_number, row
@@ -0,0 +1,197 @@
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Set, Tuple
+from uuid import UUID
+from sqlalchemy import insert, select, cast, literal, null, false, exists, case, any_, String, DateTime, Float
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as SQLAlchemyUUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.functions import func
+from config import TASK_CLAIM_TIMEOUT
+from models import task, stock_table, sku, posting
+from services.events import make_event, publish, task_events
+from services.reservation import allocate_items
+
+NOT_FOUND_PROBABILITY = 0.1
+
+
+class FinishedTasks(NamedTuple):
+    statuses: Dict[UUID, str]
+    posting_ids: Set[UUID]
+    item_ids: Set[UUID]
+    sku_ids: Set[UUID]
+
+
+def _uuid_array(values: List[UUID]):
+    return cast(values, ARRAY(SQLAlchemyUUID(as_uuid=True)))
+
+
+def finish_claim_statement(statuses: Dict[UUID, str]):
+    requested = func.unnest(
+        _uuid_array(list(statuses.keys())),
+        cast(list(statuses.values()), ARRAY(String)),
+    ).table_valued("id", "status").render_derived("requested")
+    return task.update().values(status=requested.c.status) \
+        .where(task.c.id == requested.c.id, task.c.status == "in_work") \
+        .returning(task.c.id, task.c.type, task.c.sku_id, task.c.stock, task.c.item_id, task.c.posting_id,
+                   task.c.process_id)
+
+
+async def finish_tasks(session: AsyncSession, statuses: Dict[UUID, str]) -> FinishedTasks:
+    # Applies the placing/picking state machine to a batch of tasks with a
+    # fixed number of set-based statements. Returns the final status of every
+    # task that was still in_work along with the postings, items and SKUs it
+    # touched; the caller owns the transaction.
+    result = await session.execute(finish_claim_statement(statuses))
+    claimed = result.mappings().all()
+    if len(claimed) == 0:
+        return FinishedTasks({}, set(), set(), set())
+
+    final_statuses = {row.id: statuses[row.id] for row in claimed}
+    item_ids = {row.item_id for row in claimed}
+    placing_completed = [row for row in claimed if row.type == "placing" and statuses[row.id] == "completed"]
+    picking_canceled = [row for row in claimed if row.type == "picking" and statuses[row.id] == "canceled"]
+    picking_completed = [row for row in claimed if row.type == "picking" and statuses[row.id] == "completed"]
+
+    if len(placing_completed) != 0:
+        await _place_items(session, [row.id for row in placing_completed])
+
+    if len(picking_canceled) != 0:
+        update_reserved = stock_table.update().values(reserved_state=False) \
+            .where(stock_table.c.id == any_(_uuid_array([row.item_id for row in picking_canceled])))
+        await session.execute(update_reserved)
+
+    if len(picking_completed) != 0:
+        canceled_ids, replacement_ids = await _replace_not_found(session, picking_completed)
+        for task_id in canceled_ids:
+            final_statuses[task_id] = "canceled"
+        item_ids.update(replacement_ids)
+
+    posting_ids = {row.posting_id for row in claimed if row.posting_id is not None}
+    posting_statuses = await update_posting_statuses(session, posting_ids)
+
+    events = task_events({"id": row.id, "status": final_statuses[row.id], "posting_id": row.posting_id,
+                          "process_id": row.process_id} for row in claimed)
+    events += [make_event("posting", posting_id, status=status) for posting_id, status in posting_statuses.items()]
+    await publish(session, events)
+    return FinishedTasks(final_statuses, posting_ids, item_ids, {row.sku_id for row in claimed})
+
+
+async def _place_items(session: AsyncSession, task_ids: List[UUID]) -> None:
+    # Unknown SKUs are created with a zero price; items already in stock (a
+    # canceled posting returning goods) are only released.
+    query_sku = select(task.c.sku_id, literal(0.00, Float), literal(datetime.utcnow(), DateTime), false()) \
+        .where(task.c.id == any_(_uuid_array(task_ids))) \
+        .distinct()
+    stmt_sku = pg_insert(sku).from_select(
+        ["id", "base_price", "created_at", "is_hidden"], query_sku) \
+        .on_conflict_do_nothing(index_elements=[sku.c.id])
+    await session.execute(stmt_sku)
+
+    query_stock = select(task.c.item_id, task.c.sku_id, task.c.stock, literal(datetime.utcnow(), DateTime),
+                         false(), sku.c.base_price, false(), literal(0.00, Float)) \
+        .join(sku, sku.c.id == task.c.sku_id) \
+        .where(task.c.id == any_(_uuid_array(task_ids)))
+    stmt_stock = pg_insert(stock_table).from_select(
+        ["id", "sku_id", "stock", "created_at", "reserved_state", "actual_price", "is_hidden", "markdown"],
+        query_stock)
+    stmt_stock = stmt_stock.on_conflict_do_update(index_elements=[stock_table.c.id],
+                                                  set_={"reserved_state": False})
+    await session.execute(stmt_stock)
+
+
+async def _replace_not_found(session: AsyncSession, picking_completed) -> Tuple[List[UUID], List[UUID]]:
+    # Simulates items missing on the shelf: they move to NotFound, the picking
+    # task is canceled and a free item of the same sku and stock is reserved
+    # for a new picking task. Items moved to NotFound earlier count as lost too.
+    lost = [row.item_id for row in picking_completed if random.random() < NOT_FOUND_PROBABILITY]
+    update_not_found = stock_table.update().values(stock="NotFound") \
+        .where(stock_table.c.id == any_(_uuid_array([row.item_id for row in picking_completed])),
+               (stock_table.c.stock == "NotFound") | (stock_table.c.id == any_(_uuid_array(lost)))) \
+        .returning(stock_table.c.id)
+    result = await session.execute(update_not_found)
+    not_found_items = set(result.scalars().all())
+    not_found = [row for row in picking_completed if row.item_id in not_found_items]
+    if len(not_found) == 0:
+        return [], []
+
+    quantities: Dict[tuple, int] = defaultdict(int)
+    for row in not_found:
+        quantities[(row.sku_id, row.stock)] += 1
+    allocated = await allocate_items(session, quantities)
+
+    free_items = defaultdict(list)
+    for item_id, sku_id, stock in zip(allocated.item_ids, allocated.sku_ids, allocated.stocks):
+        free_items[(sku_id, stock)].append(item_id)
+    replacements = []
+    for row in not_found:
+        if len(free_items[(row.sku_id, row.stock)]) != 0:
+            replacements.append((free_items[(row.sku_id, row.stock)].pop(), row))
+
+    if len(replacements) != 0:
+        items = func.unnest(
+            _uuid_array([item_id for item_id, row in replacements]),
+            _uuid_array([row.sku_id for item_id, row in replacements]),
+            cast([row.stock for item_id, row in replacements], ARRAY(String)),
+            _uuid_array([row.posting_id for item_id, row in replacements]),
+        ).table_valued("item_id", "sku_id", "stock", "posting_id").render_derived("replacements")
+        query_items = select(
+            func.gen_random_uuid(),
+            literal("in_work"), literal(datetime.utcnow(), DateTime),
+            literal("picking"), null(),
+            items.c.sku_id,
+            items.c.stock,
+            items.c.item_id,
+            items.c.posting_id).select_from(items)
+        stmt_new_task = insert(task).from_select(
+            ["id", "status", "created_at", "type", "process_id", "sku_id", "stock", "item_id", "posting_id"],
+            query_items)
+        await session.execute(stmt_new_task)
+
+    task_ids = [row.id for row in not_found]
+    update_canceled = task.update().values(status="canceled").where(task.c.id == any_(_uuid_array(task_ids)))
+    await session.execute(update_canceled)
+    return task_ids, [item_id for item_id, row in replacements]
+
+
+def posting_statuses_statement(posting_ids):
+    # A posting with no in_work tasks left is sent if anything was picked and
+    # canceled otherwise; evaluated once per posting, not once per task.
+    has_completed = exists().where(task.c.posting_id == posting.c.id, task.c.status == "completed")
+    has_in_work = exists().where(task.c.posting_id == posting.c.id, task.c.status == "in_work")
+    return posting.update() \
+        .values(status=case((has_completed, "sent"), else_="canceled")) \
+        .where(posting.c.id == any_(_uuid_array(list(posting_ids))),
+               posting.c.status == "in_item_pick",
+               ~has_in_work) \
+        .returning(posting.c.id, posting.c.status)
+
+
+async def update_posting_statuses(session: AsyncSession, posting_ids) -> Dict[UUID, str]:
+    if len(posting_ids) == 0:
+        return {}
+    result = await session.execute(posting_statuses_statement(posting_ids))
+    return {row.id: row.status for row in result.mappings().all()}
+
+
+def claim_tasks_statement(worker_id: str, task_type: str, limit: int, now: datetime):
+    # Hands out the oldest unclaimed in_work tasks. SKIP LOCKED lets many
+    # workers claim concurrently without queueing on the same rows; a claim
+    # older than TASK_CLAIM_TIMEOUT is treated as abandoned.
+    query_next = select(task.c.id) \
+        .where(task.c.status == "in_work",
+               task.c.type == task_type,
+               (task.c.claimed_at.is_(None)) | (task.c.claimed_at < now - timedelta(seconds=TASK_CLAIM_TIMEOUT))) \
+        .order_by(task.c.created_at) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .cte("next_tasks")
+    return task.update().values(claimed_by=worker_id, claimed_at=now) \
+        .where(task.c.id.in_(select(query_next.c.id))) \
+        .returning(task.c.id, task.c.type, task.c.created_at, task.c.process_id, task.c.posting_id,
+                   task.c.sku_id, task.c.stock, task.c.item_id)
+
+
+async def claim_tasks(session: AsyncSession, worker_id: str, task_type: str, limit: int) -> List[dict]:
+    result = await session.execute(claim_tasks_statement(worker_id, task_type, limit, datetime.utcnow()))
+    return [dict(row) for row in result.mappings().all()]
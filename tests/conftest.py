@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import asyncpg
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER  # noqa: E402
+
+
+async def _database_reachable() -> bool:
+    try:
+        connection = await asyncpg.connect(host=DB_HOST, port=int(DB_PORT), user=DB_USER, password=DB_PASS,
+                                           database=DB_NAME, timeout=2)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+        return False
+    await connection.close()
+    return True
+
+
+@pytest.fixture(scope="session")
+def run():
+    # The tests run against the Postgres configured through DB_* (migrated to
+    # head here) on one event loop, so the app's engine can be shared.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if not loop.run_until_complete(_database_reachable()):
+        loop.close()
+        pytest.skip(f"Postgres at {DB_HOST}:{DB_PORT}/{DB_NAME} is not reachable")
+
+    from alembic import command
+    from alembic.config import Config
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        command.upgrade(Config(str(ROOT / "alembic.ini")), "head")
+    finally:
+        os.chdir(cwd)
+
+    from database import engine
+    yield loop.run_until_complete
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def create_items(run):
+    from database import async_session_maker
+    from models import sku, stock_table
+
+    async def create(count: int, stock: str = "valid", base_price: float = 10.0):
+        sku_id = uuid.uuid4()
+        item_ids = sorted(uuid.uuid4() for _ in range(count))
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            await session.execute(sku.insert().values(id=sku_id, base_price=base_price, created_at=now,
+                                                      is_hidden=False))
+            await session.execute(stock_table.insert(), [
+                {"id": item_id, "sku_id": sku_id, "stock": stock, "created_at": now, "reserved_state": False,
+                 "actual_price": base_price, "is_hidden": False, "markdown": 0.0}
+                for item_id in item_ids])
+            await session.commit()
+        return sku_id, item_ids
+
+    return create
@@ -0,0 +1,37 @@
+import uuid
+
+from sqlalchemy import func, select
+
+from controllers.acceptance_api import create_acceptance, get_acceptance_info
+from database import async_session_maker
+from models import task
+from schemas import AcceptanceRequest, ItemToAccept
+
+
+def test_acceptance_info_counts_match_tasks(run):
+    # Repeated (sku, stock) lines, which one upsert can only take merged.
+    first_sku, second_sku = uuid.uuid4(), uuid.uuid4()
+    request = AcceptanceRequest(items_to_accept=[
+        ItemToAccept(sku_id=first_sku, count=3),
+        ItemToAccept(sku_id=second_sku, count=2, stock="defect"),
+        ItemToAccept(sku_id=first_sku, count=4),
+        ItemToAccept(sku_id=first_sku, count=1),
+        ItemToAccept(sku_id=second_sku, count=5, stock="defect"),
+    ])
+
+    async def accept():
+        async with async_session_maker() as session:
+            acceptance_id = (await create_acceptance(request, False, session))["id"]
+        async with async_session_maker() as session:
+            info = await get_acceptance_info(acceptance_id, None, 1000, session)
+            result = await session.execute(select(task.c.sku_id, task.c.stock, func.count())
+                                           .where(task.c.process_id == acceptance_id)
+                                           .group_by(task.c.sku_id, task.c.stock))
+            return info, result.all()
+
+    info, task_counts = run(accept())
+
+    accepted = {(sku_info["sku_id"], sku_info["stock"]): sku_info["count"] for sku_info in info["accepted"]}
+    assert accepted == {(str(first_sku), "valid"): "8", (str(second_sku), "defect"): "7"}
+    assert accepted == {(str(sku_id), stock): str(count) for sku_id, stock, count in task_counts}
+    assert len(info["task_ids"]) == 15
@@ -0,0 +1,44 @@
+import asyncio
+import json
+import uuid
+
+import asyncpg
+import pytest
+
+import services.cache
+from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from database import async_session_maker
+from services.cache import CACHE_CHANNEL, broadcast_invalidation
+
+
+@pytest.fixture(autouse=True)
+def in_process_cache(monkeypatch):
+    monkeypatch.setattr(services.cache, "_store", None)
+    monkeypatch.setattr(services.cache, "READ_CACHE_TTL", 30)
+
+
+def test_invalidation_is_sent_with_the_write(run):
+    rolled_back_sku, committed_sku = uuid.uuid4(), uuid.uuid4()
+
+    async def write_twice():
+        received = []
+        listener = await asyncpg.connect(host=DB_HOST, port=int(DB_PORT), user=DB_USER, password=DB_PASS,
+                                         database=DB_NAME)
+        await listener.add_listener(CACHE_CHANNEL, lambda conn, pid, channel, payload: received.append(payload))
+        try:
+            async with async_session_maker() as session:
+                await broadcast_invalidation(session, [], [rolled_back_sku])
+                await session.rollback()
+            async with async_session_maker() as session:
+                await broadcast_invalidation(session, [], [committed_sku])
+                await session.commit()
+            for _ in range(50):
+                if len(received) != 0:
+                    break
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+        finally:
+            await listener.close()
+        return [json.loads(payload) for payload in received]
+
+    assert run(write_twice()) == [{"skus": [str(committed_sku)]}]
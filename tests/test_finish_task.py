@@ -0,0 +1,106 @@
+import uuid
+
+import pytest
+from sqlalchemy import event, select
+
+import services.tasks
+from controllers.acceptance_api import create_acceptance
+from controllers.posting_api import create_posting
+from controllers.task_api import finish_task
+from database import async_session_maker
+from models import stock_table, task
+from schemas import AcceptanceRequest, ItemRequest, ItemToAccept, PostingRequest, RequestTask
+
+# Statements finishTask may run on its session for each branch, commit
+# excluded; the cache invalidation NOTIFY is one of them.
+STATEMENT_BUDGET = {
+    "placing_completed": 5,
+    "placing_canceled": 3,
+    "picking_completed": 5,
+    "picking_canceled": 5,
+    "picking_not_found": 8,
+}
+
+
+@pytest.fixture(autouse=True)
+def no_random_not_found(monkeypatch):
+    monkeypatch.setattr(services.tasks, "NOT_FOUND_PROBABILITY", 0)
+
+
+async def _task_ids(**filters):
+    conditions = [getattr(task.c, column) == value for column, value in filters.items()]
+    async with async_session_maker() as session:
+        result = await session.execute(select(task.c.id).where(*conditions).order_by(task.c.id))
+        return list(result.scalars().all())
+
+
+async def _placing_task():
+    request = AcceptanceRequest(items_to_accept=[ItemToAccept(sku_id=uuid.uuid4(), count=1)])
+    async with async_session_maker() as session:
+        acceptance_id = (await create_acceptance(request, False, session))["id"]
+    return (await _task_ids(process_id=acceptance_id))[0]
+
+
+async def _picking_task(create_items):
+    sku_id, item_ids = await create_items(2)
+    request = PostingRequest(ordered_goods=[ItemRequest(sku=sku_id, from_valid_ids=item_ids[:1], from_defect_ids=[])])
+    async with async_session_maker() as session:
+        posting_id = (await create_posting(request, session))["id"]
+    return (await _task_ids(posting_id=posting_id, type="picking"))[0], item_ids[0]
+
+
+async def _finish_counting(task_id, status):
+    statements = []
+    commits = []
+    async with async_session_maker() as session:
+        connection = (await session.connection()).sync_connection
+        event.listen(connection, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        event.listen(connection, "commit", lambda conn: commits.append(conn))
+        response = await finish_task(RequestTask(id=task_id, status=status), session)
+    return response, statements, commits
+
+
+@pytest.mark.parametrize("branch, status", [("placing_completed", "completed"), ("placing_canceled", "canceled")])
+def test_finish_placing_task_query_budget(run, branch, status):
+    task_id = run(_placing_task())
+
+    response, statements, commits = run(_finish_counting(task_id, status))
+
+    assert response["status"] == status
+    assert len(statements) == STATEMENT_BUDGET[branch], statements
+    assert len(commits) == 1
+
+
+@pytest.mark.parametrize("branch, status", [("picking_completed", "completed"), ("picking_canceled", "canceled")])
+def test_finish_picking_task_query_budget(run, create_items, branch, status):
+    task_id, item_id = run(_picking_task(create_items))
+
+    response, statements, commits = run(_finish_counting(task_id, status))
+
+    assert response["status"] == status
+    assert len(statements) == STATEMENT_BUDGET[branch], statements
+    assert len(commits) == 1
+
+
+def test_finish_not_found_picking_task_query_budget(run, create_items):
+    task_id, item_id = run(_picking_task(create_items))
+
+    async def move_to_not_found():
+        async with async_session_maker() as session:
+            await session.execute(stock_table.update().values(stock="NotFound").where(stock_table.c.id == item_id))
+            await session.commit()
+
+    run(move_to_not_found())
+    response, statements, commits = run(_finish_counting(task_id, "completed"))
+
+    assert response["status"] == "canceled"
+    assert len(statements) == STATEMENT_BUDGET["picking_not_found"], statements
+    assert len(commits) == 1
+    replacement_ids = run(_task_ids(type="picking", status="in_work", posting_id=run(_posting_of(task_id))))
+    assert len(replacement_ids) == 1
+
+
+async def _posting_of(task_id):
+    async with async_session_maker() as session:
+        return (await session.execute(select(task.c.posting_id).where(task.c.id == task_id))).scalar()
@@ -0,0 +1,33 @@
+import uuid
+
+import httpx
+from sqlalchemy import select
+
+from database import async_session_maker
+from main import app
+from models import stock_table
+
+
+def test_markdown_items_reports_unknown_ids(run, create_items):
+    sku_id, item_ids = run(create_items(1))
+    unknown_id = uuid.uuid4()
+
+    async def mark_down():
+        # Through the app, so the error detail is serialized like a real
+        # response; no lifespan, the endpoint needs neither broker nor workers.
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/markdownItems", json={"items": [
+                {"id": str(item_ids[0]), "percentage": 0.5}, {"id": str(unknown_id), "percentage": 0.5}]})
+
+    response = run(mark_down())
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == {"message": "Some ID not found", "ids": [str(unknown_id)]}
+
+    async def markdown():
+        async with async_session_maker() as session:
+            result = await session.execute(select(stock_table.c.markdown).where(stock_table.c.id == item_ids[0]))
+            return result.scalar()
+
+    assert run(markdown()) == 0.0
@@ -0,0 +1,12 @@
+from database import async_session_maker
+from services.query_plans import check_query_plans
+
+
+def test_hot_queries_use_indexes(run):
+    async def failures():
+        async with async_session_maker() as session:
+            result = await check_query_plans(session)
+            await session.rollback()
+            return result
+
+    assert run(failures()) == []
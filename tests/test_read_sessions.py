@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import database
+from database import DATABASE_URL, open_read_session
+
+
+def _use_replica(monkeypatch, url):
+    replica = create_async_engine(url)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    monkeypatch.setattr(database, "DB_REPLICA_HOSTS", [url])
+    monkeypatch.setattr(database, "_replica_order", itertools.cycle([0]))
+    monkeypatch.setattr(database, "_replica_down_until", {})
+    return replica
+
+
+@pytest.fixture
+def reachable_replica(run, monkeypatch):
+    replica = _use_replica(monkeypatch, DATABASE_URL)
+    yield replica
+    run(replica.dispose())
+
+
+@pytest.fixture
+def unreachable_replica(run, monkeypatch):
+    replica = _use_replica(monkeypatch, DATABASE_URL.replace(f"@{database.DB_HOST}:{database.DB_PORT}/",
+                                                             "@127.0.0.1:1/"))
+    yield replica
+    run(replica.dispose())
+
+
+def test_unused_read_session_does_not_connect(run, unreachable_replica):
+    async def open_and_close():
+        async with await open_read_session() as session:
+            pass
+        return session
+
+    session = run(open_and_close())
+
+    assert session.sync_session.bind is None
+    assert database._replica_down_until == {}
+
+
+def test_read_session_uses_replica(run, reachable_replica):
+    async def read():
+        async with await open_read_session() as session:
+            return (await session.execute(text("select 1"))).scalar(), session.sync_session.bind
+
+    assert run(read()) == (1, reachable_replica.sync_engine)
+
+
+def test_unreachable_replica_falls_back_on_first_statement(run, unreachable_replica):
+    async def read():
+        async with await open_read_session() as session:
+            return (await session.execute(text("select 1"))).scalar(), session.sync_session.bind
+
+    assert run(read()) == (1, database.engine.sync_engine)
+    assert 0 in database._replica_down_until
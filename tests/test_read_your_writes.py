@@ -0,0 +1,53 @@
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from database import READ_PRIMARY_COOKIE, ReadYourWritesMiddleware
+
+
+def _client():
+    app = FastAPI()
+
+    @app.get("/read")
+    async def read():
+        return {}
+
+    @app.post("/write")
+    async def write():
+        return {}
+
+    @app.post("/fail")
+    async def fail():
+        raise HTTPException(status_code=409, detail="Conflict")
+
+    @app.post("/stream")
+    async def stream():
+        return StreamingResponse(iter(["a\n", "b\n"]))
+
+    app.add_middleware(ReadYourWritesMiddleware)
+    return TestClient(app)
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    monkeypatch.setattr("database.replica_engines", [object()])
+    monkeypatch.setattr("database.READ_YOUR_WRITES_WINDOW", 5)
+
+
+@pytest.mark.parametrize("method, path, marked", [("GET", "/read", False), ("POST", "/write", True),
+                                                  ("POST", "/fail", False), ("POST", "/stream", True)])
+def test_successful_writes_mark_read_primary(replicas, method, path, marked):
+    response = _client().request(method, path)
+
+    assert (READ_PRIMARY_COOKIE in response.cookies) == marked
+    if path == "/stream":
+        assert response.text == "a\nb\n"
+
+
+def test_no_cookie_without_replicas(monkeypatch):
+    monkeypatch.setattr("database.replica_engines", [])
+
+    response = _client().post("/write")
+
+    assert READ_PRIMARY_COOKIE not in response.cookies
@@ -0,0 +1,128 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, func
+
+from controllers.posting_api import create_posting
+from controllers.task_api import finish_task
+from database import async_session_maker
+from models import posting, stock_table, task, sku_stock_counter
+from schemas import ItemRequest, PostingRequest, RequestTask
+from services.reservation import RequestedItems, reserve_items
+from services.scheduler import run_stock_counter_compaction
+from services.stock_counters import verify_stock_counters
+
+ITEMS = 12
+POSTINGS = 24
+ITEMS_PER_POSTING = 3
+MIXED_OPERATIONS = 200
+
+
+async def _create_posting(sku_id, item_ids):
+    request = PostingRequest(ordered_goods=[ItemRequest(sku=sku_id, from_valid_ids=item_ids, from_defect_ids=[])])
+    async with async_session_maker() as session:
+        try:
+            return (await create_posting(request, session))["id"]
+        except HTTPException as exc:
+            return exc
+
+
+def test_parallel_postings_never_reserve_an_item_twice(run, create_items):
+    sku_id, item_ids = run(create_items(ITEMS))
+    requests = [[item_ids[(i + offset) % ITEMS] for offset in range(ITEMS_PER_POSTING)] for i in range(POSTINGS)]
+
+    async def scenario():
+        return await asyncio.gather(*[_create_posting(sku_id, ids) for ids in requests])
+
+    outcomes = run(scenario())
+    posting_ids = [outcome for outcome in outcomes if not isinstance(outcome, HTTPException)]
+    losers = [outcome for outcome in outcomes if isinstance(outcome, HTTPException)]
+
+    assert len(posting_ids) > 0
+    assert [loser.status_code for loser in losers] == [409] * len(losers)
+
+    async def picked_items():
+        async with async_session_maker() as session:
+            result = await session.execute(select(task.c.item_id).where(task.c.posting_id.in_(posting_ids)))
+            picked = Counter(result.scalars().all())
+            result = await session.execute(select(stock_table.c.id).where(stock_table.c.id.in_(item_ids),
+                                                                          stock_table.c.reserved_state.is_(True)))
+            reserved = set(result.scalars().all())
+            result = await session.execute(select(func.count()).where(posting.c.id.in_(posting_ids)))
+            return picked, reserved, result.scalar()
+
+    picked, reserved, posting_count = run(picked_items())
+    assert max(picked.values()) == 1
+    assert set(picked) == reserved
+    assert len(picked) == ITEMS_PER_POSTING * len(posting_ids)
+    assert posting_count == len(posting_ids)
+
+
+@pytest.mark.parametrize("sessions", [2, 8])
+def test_parallel_reserve_items_split_overlapping_requests(run, create_items, sessions):
+    sku_id, item_ids = run(create_items(ITEMS))
+
+    async def reserve():
+        requested = RequestedItems()
+        for item_id in item_ids:
+            requested.add(item_id, sku_id, "valid")
+        async with async_session_maker() as session:
+            reserved = await reserve_items(session, requested)
+            await asyncio.sleep(0.05)
+            await session.commit()
+            return reserved
+
+    async def scenario():
+        return await asyncio.gather(*[reserve() for _ in range(sessions)])
+
+    reserved = [item_id for batch in run(scenario()) for item_id in batch]
+    assert sorted(reserved) == item_ids
+
+
+async def _cancel_task(task_id):
+    async with async_session_maker() as session:
+        try:
+            return (await finish_task(RequestTask(id=task_id, status="canceled"), session))["status"]
+        except HTTPException as exc:
+            return exc
+
+
+def test_parallel_reserve_and_release_on_one_sku(run, create_items):
+    # Reservations and releases move items between the same counter rows in
+    # opposite directions; neither may deadlock against the other.
+    sku_id, item_ids = run(create_items(2 * MIXED_OPERATIONS))
+    reserved_ids, free_ids = item_ids[:MIXED_OPERATIONS], item_ids[MIXED_OPERATIONS:]
+    posting_ids = [run(_create_posting(sku_id, [item_id])) for item_id in reserved_ids]
+
+    async def picking_tasks():
+        async with async_session_maker() as session:
+            result = await session.execute(select(task.c.id).where(task.c.posting_id.in_(posting_ids)))
+            return list(result.scalars().all())
+
+    task_ids = run(picking_tasks())
+
+    async def scenario():
+        return await asyncio.gather(*[_create_posting(sku_id, [item_id]) for item_id in free_ids],
+                                    *[_cancel_task(task_id) for task_id in task_ids],
+                                    *[run_stock_counter_compaction() for _ in range(4)],
+                                    return_exceptions=True)
+
+    outcomes = run(scenario())
+    failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    assert failures == []
+
+    async def compacted():
+        await run_stock_counter_compaction()
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(sku_stock_counter.c.reserved_state, func.count(), func.sum(sku_stock_counter.c.item_count))
+                .where(sku_stock_counter.c.sku_id == sku_id)
+                .group_by(sku_stock_counter.c.reserved_state))
+            counters = {row[0]: (row[1], row[2]) for row in result.all()}
+            return counters, await verify_stock_counters(session)
+
+    counters, drift = run(compacted())
+    assert drift == []
+    assert counters == {False: (1, MIXED_OPERATIONS), True: (1, MIXED_OPERATIONS)}
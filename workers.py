@@ -0,0 +1,7 @@
+from uvicorn.workers import UvicornWorker
+from config import SERVER_LOOP, SERVER_HTTP
+
+
+class Worker(UvicornWorker):
+    # "auto" picks uvloop and httptools when they are installed.
+    CONFIG_KWARGS = {"loop": SERVER_LOOP, "http": SERVER_HTTP, "lifespan": "on"}